@@ -0,0 +1,89 @@
+# compares the vectorized post-detection stage of BoardReader (board corners, piece centers and board grid) with the per-detection
+# python loops it replaced, using the arucos found in a real image
+from board_reader import BoardReader
+from numpy import int32, int8, zeros, mean, flip, array_equal, concatenate
+from timeit import timeit
+from contextlib import redirect_stdout
+from io import StringIO
+
+resolution = (1920, 1080)
+board_dimensions = (8, 12)
+repetitions = 1000
+
+def legacyGetBoardCorners(reader, ids_and_corners):
+	corners = zeros((4, 2), int32)
+	found_corner = [0] * 4
+	for i in range(len(ids_and_corners[0])):
+		id = ids_and_corners[0][i]
+		if 0 <= id and id <= 3:
+			found_corner[id] += 1
+			corners[id] = ids_and_corners[1][i][0]
+	return corners
+
+def legacyGetPieceCenters(ids_and_corners):
+	filtered_ids = []
+	piece_centers = []
+	ids = ids_and_corners[0]
+	centers = mean(ids_and_corners[1], axis=1)
+	for i in range(len(ids)):
+		id = ids[i]
+		if id < 4:
+			continue
+		if id <= 15:
+			filtered_ids.append(id)
+			piece_centers.append(centers[i])
+	return [filtered_ids, int32(piece_centers)]
+
+def legacyGenerateBoard(reader, piece_centers):
+	board = zeros(reader.board_dimensions, dtype = int8)
+	real_positions = zeros((reader.board_dimensions[0], reader.board_dimensions[1], 2), dtype = int32)
+	ids = piece_centers[0]
+	coordinates = flip(int8(piece_centers[1] / reader._getBoardSquareDimensions()), axis=1)
+	for i in range(len(ids)):
+		id = ids[i]
+		coord = coordinates[i]
+		if coord[0] > reader.board_dimensions[0] or coord[1] > reader.board_dimensions[1]:
+			continue
+		if board[coord[0]][coord[1]] != 0:
+			if board[coord[0]][coord[1]] != id:
+				# same as the old in-place *= 100 and += id, wrapping around int8 without relying on numpy's scalar overflow rules
+				board[coord[0]][coord[1]] = int8((int(board[coord[0]][coord[1]]) * 100 + id + 128) % 256 - 128)
+			continue
+		board[coord[0]][coord[1]] = id
+		real_positions[coord[0]][coord[1]] = piece_centers[1][i]
+	return flip(board, axis=0), real_positions
+
+def runLegacy(reader, ids_and_corners, transformed):
+	legacyGetBoardCorners(reader, ids_and_corners)
+	return legacyGenerateBoard(reader, legacyGetPieceCenters(transformed))
+
+def runVectorized(reader, ids_and_corners, transformed):
+	reader._getBoardCorners(ids_and_corners)
+	return reader._generateBoard(reader._getPieceCenters(transformed))
+
+def compare(name, reader, ids_and_corners):
+	board_corners = reader._getBoardCorners(ids_and_corners)
+	transformed = reader._trasformPerspective(board_corners, [ids_and_corners[0], ids_and_corners[1].copy()])
+
+	with redirect_stdout(StringIO()): # both versions print a line per duplicate
+		legacy_board, legacy_positions = runLegacy(reader, ids_and_corners, transformed)
+		board, positions = runVectorized(reader, ids_and_corners, transformed)
+		legacy_time = timeit(lambda: runLegacy(reader, ids_and_corners, transformed), number=repetitions) / repetitions
+		vectorized_time = timeit(lambda: runVectorized(reader, ids_and_corners, transformed), number=repetitions) / repetitions
+
+	identical = array_equal(legacy_board, board) and array_equal(legacy_positions, positions)
+	print(f"{name}: {len(ids_and_corners[0])} arucos, loops {legacy_time * 1e6:.1f} us, vectorized {vectorized_time * 1e6:.1f} us, speedup {legacy_time / vectorized_time:.1f}x, identical results: {identical}")
+
+reader = BoardReader(resolution, board_dimensions, DEBUG_MODE = True, debug_path = "test_image_real.png")
+ids_and_corners = reader._getArucoCorners()
+
+compare("real image", reader, ids_and_corners)
+
+# every piece detected three times, as happens when the same frame is merged from overlapping detections
+compare("triplicated detections", reader, [concatenate([ids_and_corners[0]] * 3), concatenate([ids_and_corners[1]] * 3)])
+
+# a second piece detected on top of the first piece, then the first one again, as when a piece being captured is still seen
+is_piece = (ids_and_corners[0] >= 4) & (ids_and_corners[0] <= 15)
+first, second = ids_and_corners[0][is_piece][:2]
+first_corners = ids_and_corners[1][is_piece][:1]
+compare("colliding pieces", reader, [concatenate([ids_and_corners[0], [second, first]]), concatenate([ids_and_corners[1], first_corners, first_corners])])
@@ -0,0 +1,251 @@
+# replays the bundled image sets through BoardReader at each resolution listed in main.py, reporting the latency of every stage,
+# how many arucos were found, how often boards read with missing board corners matched the reference board and which moves were emitted.
+# Boards read with the chosen detection options are checked against full-frame detection.
+# Sessions recorded with frame_recording.py can be replayed too. Results are saved as benchmark_results/<commit>.json,
+# and --compare prints how they changed from an earlier result file
+from board_reader import BoardReader
+from replay_camera import Camera as ReplayCamera
+from camera_error import ReplayFinished
+from stage_timer import StageTimer
+from cv2 import __version__ as cv2_version
+from numpy import abs as absolute, mean
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import StringIO
+from json import dump, load
+from os import listdir, makedirs
+from os.path import isfile, join, basename
+from subprocess import run
+
+# the resolutions listed in main.py
+resolutions = [(640, 480), (960, 720), (1280, 960), (1440, 1056), (1920, 1088), (1920, 1296), (2528, 1808), (3296, 2464)]
+board_dimensions = (8, 12)
+
+# sequences are read in order and their moves are reported, corner sets are read one image at a time (see benchmarkCorners)
+single_images = {"test_image_real": ["test_image_real.png"]}
+sequences = ["f_test_generate_moves", "f_test_generate_capture"]
+corner_sets = ["test_images_find_corners"]
+corner_reference = "AAA.png" # the image of the corner set where every board corner is visible
+# read with the benchmarked options and with full-frame detection, whose boards detecting in crops (tiles, roi_tracking, the pyramid's
+# full resolution decode) or tracking must not change
+full_detection_images = ["test_image_real.png", join(corner_sets[0], corner_reference)]
+
+def listImages(directory):
+	return sorted([join(directory, f) for f in listdir(directory) if isfile(join(directory, f))])
+
+def getCommit():
+	'''returns the current commit hash, marked with -dirty if the tree has uncommitted changes'''
+	commit = run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or "unknown"
+	dirty = run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+	return commit + "-dirty" if dirty else commit
+
+class SetResult:
+	'''what was measured while reading one image set at one resolution'''
+
+	def __init__(self, reader):
+		self.reader = reader
+		self.timer = StageTimer()
+		reader.timer = self.timer
+		self.markers_found = []
+		self.boards_read = 0
+		self.moves = []
+
+	def read(self, source, resolution):
+		'''replays the source through the reader. Frames are decoded and rescaled to the resolution ahead of time like on the camera
+		thread, though upscaled frames don't gain any detail, so this only approximates capturing at that resolution'''
+		if self.reader.camera is not None:
+			self.reader.camera.close()
+		self.reader.camera = ReplayCamera(resolution, source, grayscale = True)
+		while True:
+			boards_before = sum(self.reader.getHomographyCacheStats())
+			try:
+				with self.timer.measure("total"):
+					moves = self.reader.updateBoardGetMoves()
+			except ReplayFinished:
+				return
+			self.markers_found.append(self.reader.getMarkersFound())
+			self.boards_read += sum(self.reader.getHomographyCacheStats()) - boards_before
+			if len(moves) > 0:
+				self.moves.append({"image": self.reader.camera.getFrameName(), "moves": moves})
+
+	def getSummary(self):
+		latency = {stage: {key: value * 1000 if key != "count" else value for key, value in stats.items()} for stage, stats in self.timer.getSnapshot().items()}
+		return {
+			"frames": len(self.markers_found),
+			"boards_read": self.boards_read,
+			"markers_found": {"mean": float(mean(self.markers_found)), "min": min(self.markers_found), "max": max(self.markers_found)},
+			"latency_ms": latency,
+			"moves": self.moves,
+		}
+
+def repeatImages(images, repeat):
+	return [image for image in images for _ in range(repeat)]
+
+def benchmarkSequence(reader, source, resolution):
+	reader.resetTracking()
+	result = SetResult(reader)
+	result.read(source, resolution)
+	return result.getSummary()
+
+def readBoard(result, images, resolution):
+	'''returns the board read from the images, or None if their board corners weren't found'''
+	reader = result.reader
+	boards_before = sum(reader.getHomographyCacheStats())
+	result.read(images, resolution)
+	if sum(reader.getHomographyCacheStats()) == boards_before:
+		return None
+	return reader.getBoard().copy()
+
+def countWrongSquares(board, reference_board):
+	return None if board is None else int((board != reference_board).sum())
+
+def getMatchRate(wrong_squares):
+	return sum(1 for wrong in wrong_squares.values() if wrong == 0) / len(wrong_squares)
+
+def benchmarkCorners(reader, images, resolution, repeat):
+	'''reads every image from a cold start, where missing board corners can only be recovered from the image itself, and again right
+	after the reference image, where they can be recovered from the corners found in it. Every image shows the same pieces as the
+	reference, so the boards read are compared with the reference board: recovering corners in the wrong place reads the wrong squares'''
+	result = SetResult(reader)
+	reference = next(image for image in images if basename(image) == corner_reference)
+	reader.resetTracking()
+	reference_board = readBoard(result, repeatImages([reference], repeat), resolution)
+	if reference_board is None:
+		return result.getSummary()
+	reference_corners = reader.last_position_corners.copy()
+
+	corner_errors = {}
+	cold_wrong_squares = {}
+	warm_wrong_squares = {}
+	for image in images:
+		reader.resetTracking()
+		board = readBoard(result, repeatImages([image], repeat), resolution)
+		cold_wrong_squares[basename(image)] = countWrongSquares(board, reference_board)
+		corner_errors[basename(image)] = None if board is None else int(absolute(reader.last_position_corners - reference_corners).max())
+		reader.resetTracking()
+		result.read(repeatImages([reference], repeat), resolution)
+		board = readBoard(result, repeatImages([image], repeat), resolution)
+		warm_wrong_squares[basename(image)] = countWrongSquares(board, reference_board)
+
+	summary = result.getSummary()
+	# for each image, the largest distance in pixels between its board corners and the ones found in the reference image, and how many
+	# squares of its board differ from the reference board, None if its board corners weren't found
+	summary["corner_error_px"] = corner_errors
+	summary["wrong_squares"] = cold_wrong_squares
+	summary["wrong_squares_after_reference"] = warm_wrong_squares
+	# how often the board read matched the reference board
+	summary["board_match_rate"] = getMatchRate(cold_wrong_squares)
+	summary["board_match_rate_after_reference"] = getMatchRate(warm_wrong_squares)
+	return summary
+
+def compareWithFullDetection(resolution, options):
+	'''reads each image twice, the second time around the board found the first time, both with the benchmarked options and with
+	full-frame detection. Returns how many squares of the last boards they read differ for each image, None if either found no board'''
+	wrong_squares = {}
+	with redirect_stdout(StringIO()):
+		for image in full_detection_images:
+			boards = []
+			for reader_options in (options, {}):
+				try:
+					reader = BoardReader(resolution, board_dimensions, camera = ReplayCamera(resolution, [image, image], grayscale = True), **reader_options)
+					reader.updateBoard()
+					boards.append(reader.getBoard())
+					reader.camera.close()
+				except ReplayFinished:
+					boards.append(None)
+			wrong_squares[basename(image)] = None if boards[1] is None else countWrongSquares(boards[0], boards[1])
+	return wrong_squares
+
+def benchmarkResolution(resolution, options, repeat, recordings):
+	with redirect_stdout(StringIO()): # the reader prints every missing corner and misplaced piece
+		try:
+			reader = BoardReader(resolution, board_dimensions, camera = ReplayCamera(resolution, "test_image_real.png", grayscale = True), **options)
+		except ReplayFinished:
+			return None # the board corners weren't found at this resolution
+		results = {}
+		for name, images in single_images.items():
+			results[name] = benchmarkSequence(reader, repeatImages(images, repeat), resolution)
+		for name in sequences:
+			results[name] = benchmarkSequence(reader, repeatImages(listImages(name), repeat), resolution)
+		for recording in recordings:
+			results[basename(recording)] = benchmarkSequence(reader, recording, resolution)
+		for name in corner_sets:
+			results[name] = benchmarkCorners(reader, listImages(name), resolution, repeat)
+	return results
+
+def printResults(resolution, results):
+	print(f"{resolution[0]}x{resolution[1]}")
+	if results is None:
+		print("\tboard corners not found in test_image_real.png")
+		return
+	for name, summary in results.items():
+		total = summary["latency_ms"]["total"]
+		line = f"\t{name}: {summary['frames']} frames, {summary['boards_read']} boards, {summary['markers_found']['mean']:.1f} arucos, "
+		line += f"p50 {total['p50']:.1f} ms, p95 {total['p95']:.1f} ms, p99 {total['p99']:.1f} ms"
+		if "board_match_rate" in summary:
+			line += f", boards match the reference {summary['board_match_rate']:.0%} cold, {summary['board_match_rate_after_reference']:.0%} after it"
+		if summary["moves"]:
+			line += f", moves {[move['moves'] for move in summary['moves']]}"
+		print(line)
+
+def printComparison(results, previous):
+	print(f"compared to {previous['commit']}:")
+	for resolution, sets in results["resolutions"].items():
+		for name, summary in (sets or {}).items():
+			old = (previous["resolutions"].get(resolution) or {}).get(name)
+			if old is None:
+				continue
+			p50, old_p50 = summary["latency_ms"]["total"]["p50"], old["latency_ms"]["total"]["p50"]
+			line = f"\t{resolution} {name}: p50 {old_p50:.1f} -> {p50:.1f} ms ({(p50 - old_p50) / old_p50:+.0%})"
+			line += f", arucos {old['markers_found']['mean']:.1f} -> {summary['markers_found']['mean']:.1f}"
+			if "board_match_rate" in summary and "board_match_rate" in old:
+				line += f", boards matching {old['board_match_rate']:.0%} -> {summary['board_match_rate']:.0%} cold"
+				line += f", {old['board_match_rate_after_reference']:.0%} -> {summary['board_match_rate_after_reference']:.0%} after the reference"
+			if summary["moves"] != old["moves"]:
+				line += ", MOVES CHANGED"
+			print(line)
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = "replays the bundled image sets through BoardReader at each resolution listed in main.py")
+	parser.add_argument("--resolutions", nargs = "+", help = "only these resolutions, as WIDTHxHEIGHT")
+	parser.add_argument("--repeat", type = int, default = 5, help = "how many times each image is read")
+	parser.add_argument("--engine", default = "full", choices = ["full", "pyramid", "tiles"], help = "aruco detection engine")
+	parser.add_argument("--roi-tracking", action = "store_true")
+	parser.add_argument("--flow-tracking", action = "store_true", help = "follow the arucos with optical flow between full detections")
+	parser.add_argument("--recordings", nargs = "+", default = [], help = "sessions recorded with frame_recording.py to replay, once each, after the bundled sets")
+	parser.add_argument("--output", default = "benchmark_results", help = "directory the results are saved to")
+	parser.add_argument("--compare", help = "an earlier result file to compare with")
+	arguments = parser.parse_args()
+
+	selected = resolutions
+	if arguments.resolutions:
+		selected = [tuple(int(size) for size in resolution.split("x")) for resolution in arguments.resolutions]
+	options = {"detection_engine": arguments.engine, "roi_tracking": arguments.roi_tracking, "flow_tracking": arguments.flow_tracking}
+
+	results = {
+		"commit": getCommit(),
+		"date": datetime.now().isoformat(timespec = "seconds"),
+		"opencv": cv2_version,
+		"repeat": arguments.repeat,
+		"options": options,
+		"recordings": arguments.recordings,
+		"resolutions": {},
+		"wrong_squares_vs_full_detection": {},
+	}
+	for resolution in selected:
+		name = f"{resolution[0]}x{resolution[1]}"
+		results["resolutions"][name] = benchmarkResolution(resolution, options, arguments.repeat, arguments.recordings)
+		printResults(resolution, results["resolutions"][name])
+		results["wrong_squares_vs_full_detection"][name] = compareWithFullDetection(resolution, options)
+		print(f"\tsquares differing from full-frame detection: {results['wrong_squares_vs_full_detection'][name]}")
+
+	makedirs(arguments.output, exist_ok = True)
+	path = join(arguments.output, f"{results['commit']}.json")
+	with open(path, "w") as f:
+		dump(results, f, indent = 4)
+	print(f"results saved to {path}")
+
+	if arguments.compare:
+		with open(arguments.compare) as f:
+			printComparison(results, load(f))
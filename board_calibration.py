@@ -0,0 +1,44 @@
+from numpy import int32, float64, array, array_equal
+from datetime import datetime
+from json import dump, load
+from os.path import isfile
+
+class BoardCalibration:
+	'''where the board corners were last found in the camera image, the homography mapping them to the image corners and the resolution
+	they were found at, saved so later startups don't need to see every board corner before reading the board'''
+
+	def __init__(self, resolution, corners, homography):
+		self.resolution = int32(resolution)
+		self.corners = int32(corners)
+		self.homography = float64(homography)
+
+	def matchesResolution(self, resolution) -> bool:
+		return array_equal(self.resolution, int32(resolution))
+
+	def matchesCorners(self, found_corner, corners, tolerance, min_corners) -> bool:
+		'''returns True if at least min_corners board corners were found, all of them within tolerance pixels of the calibrated ones'''
+		found = found_corner > 0
+		if found.sum() < min_corners:
+			return False
+		return abs(int32(corners[found]) - self.corners[found]).max() <= tolerance
+
+	def save(self, path):
+		with open(path, "w") as f:
+			dump({
+				"resolution": self.resolution.tolist(),
+				"corners": self.corners.tolist(),
+				"homography": self.homography.tolist(),
+				"saved": datetime.now().isoformat(timespec = "seconds"),
+			}, f, indent = 4)
+
+def loadCalibration(path):
+	'''returns the calibration saved at path, or None if there is none or it can't be read'''
+	if path is None or not isfile(path):
+		return None
+	try:
+		with open(path) as f:
+			calibration = load(f)
+		return BoardCalibration(calibration["resolution"], array(calibration["corners"]).reshape((4, 2)), array(calibration["homography"]).reshape((3, 3)))
+	except (ValueError, KeyError) as error:
+		print(f"ignoring calibration file {path}: {error}")
+		return None
@@ -0,0 +1,161 @@
+from board_reader import BoardReader
+from uci_string_generator import convertUCIPossibleMoves
+from numpy import empty
+from collections import deque
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+class DropOldestQueue:
+	'''bounded queue where putting an item into a full queue discards the oldest item instead of blocking, so slow stages always work on recent frames'''
+
+	def __init__(self, max_size):
+		self.items = deque(maxlen = max_size)
+		self.dropped = 0
+		self.closed = False
+		self.condition = Condition()
+
+	def put(self, item):
+		with self.condition:
+			if len(self.items) == self.items.maxlen:
+				self.dropped += 1
+			self.items.append(item)
+			self.condition.notify()
+
+	def get(self):
+		'''blocks until an item is available and returns it, or returns None once the queue is closed'''
+		with self.condition:
+			self.condition.wait_for(lambda: len(self.items) > 0 or self.closed)
+			if self.closed:
+				return None
+			return self.items.popleft()
+
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+
+	def getDepth(self):
+		return len(self.items)
+
+class BoardPipeline:
+	'''runs the stages of BoardReader.updateBoard concurrently: a capture thread, a pool of detection threads and an interpretation thread,
+	connected by bounded queues. While frame N is being interpreted, frame N+1 is already being captured and detected.
+	OpenCV releases the GIL while detecting, so the detection threads run in parallel.
+	The reader must not be updated directly while the pipeline is running'''
+
+	def __init__(self, reader: BoardReader, detection_workers = 3, queue_size = 2, throughput_window = 10):
+		if reader.write_steps:
+			raise ValueError("the board pipeline can't write debug images, since they are shared by all frames being processed")
+		if reader.flow_tracking:
+			raise ValueError("the board pipeline can't follow arucos with optical flow, since frames are detected out of order by several threads")
+		self.reader = reader
+		self.detection_workers = detection_workers
+		self.detection_queue = DropOldestQueue(queue_size)
+		self.interpretation_queue = DropOldestQueue(queue_size)
+
+		self.lock = Lock()
+		self.possible_moves = empty(0, dtype=BoardReader.move_dtype)
+		self.last_interpreted_sequence = 0
+		self.out_of_order_frames = 0
+		self.board_timestamps = deque(maxlen = throughput_window)
+		self.running = False
+		self.threads = []
+		self.error = None
+
+	def start(self):
+		self.reader.waitUntilReady()
+		self.running = True
+		self.threads = [Thread(target=self.__capture)]
+		self.threads += [Thread(target=self.__detect) for _ in range(self.detection_workers)]
+		self.threads.append(Thread(target=self.__interpret))
+		for thread in self.threads:
+			thread.daemon = True
+			thread.start()
+
+	def stop(self):
+		self.running = False
+		self.detection_queue.close()
+		self.interpretation_queue.close()
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
+
+	def __stopOnError(self, error):
+		print(f"board pipeline stopped: {error}")
+		self.error = error
+		self.running = False
+		self.detection_queue.close()
+		self.interpretation_queue.close()
+
+	def __capture(self):
+		sequence = 0
+		try:
+			while self.running:
+				# asks for a frame newer than the last one, whatever the camera's default is, so a frame is never detected twice
+				img, gray = self.reader._captureFrame(self.reader.camera.getSequence() + 1)
+				sequence += 1
+				if self.reader.motion_gating and not self.reader._shouldReadFrame(gray):
+					continue
+				# the camera reuses its frame buffers, so a frame waiting to be detected could be overwritten by a later capture
+				gray = gray.copy()
+				img = gray if img.ndim == 2 else img.copy()
+				self.detection_queue.put((sequence, img, gray, self.reader.gate_frame))
+		except Exception as error:
+			self.__stopOnError(error)
+
+	def __detect(self):
+		try:
+			while (frame := self.detection_queue.get()) is not None:
+				sequence, img, gray, gate_frame = frame
+				ids_and_corners, detection_path = self.reader._detectArucoCorners(img, gray)
+				self.interpretation_queue.put((sequence, ids_and_corners, detection_path, gate_frame))
+		except Exception as error:
+			self.__stopOnError(error)
+
+	def __interpret(self):
+		try:
+			while (detection := self.interpretation_queue.get()) is not None:
+				sequence, ids_and_corners, detection_path, gate_frame = detection
+				# detection workers can finish out of order; a frame older than the last board would undo its moves
+				if sequence < self.last_interpreted_sequence:
+					self.out_of_order_frames += 1
+					continue
+				self.last_interpreted_sequence = sequence
+				with self.lock:
+					self.reader._recordDetection(ids_and_corners, detection_path)
+					self.reader._interpretArucoCorners(ids_and_corners, gate_frame)
+					if len(self.reader.possible_moves) > 0:
+						self.possible_moves = self.reader.possible_moves
+						self.reader.possible_moves = empty(0, dtype=BoardReader.move_dtype)
+					self.board_timestamps.append(monotonic())
+		except Exception as error:
+			self.__stopOnError(error)
+
+	def getMoves(self) -> list[str]:
+		'''returns the moves found since the last call, as UCI strings'''
+		with self.lock:
+			possible_moves = self.possible_moves
+			self.possible_moves = empty(0, dtype=BoardReader.move_dtype)
+		return convertUCIPossibleMoves(possible_moves)
+
+	def getBoard(self):
+		with self.lock:
+			return self.reader.getBoard()
+
+	def getThroughput(self) -> float:
+		'''returns how many boards per second were interpreted, over the last throughput_window boards'''
+		with self.lock:
+			if len(self.board_timestamps) < 2:
+				return 0.0
+			return (len(self.board_timestamps) - 1) / (self.board_timestamps[-1] - self.board_timestamps[0])
+
+	def getStats(self) -> dict:
+		'''returns the throughput and, for each queue between stages, how many frames are waiting and how many were dropped'''
+		return {
+			"boards_per_second": self.getThroughput(),
+			"detection_queue_depth": self.detection_queue.getDepth(),
+			"detection_queue_dropped": self.detection_queue.dropped,
+			"interpretation_queue_depth": self.interpretation_queue.getDepth(),
+			"interpretation_queue_dropped": self.interpretation_queue.dropped,
+			"out_of_order_frames": self.out_of_order_frames,
+		}
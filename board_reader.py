@@ -1,14 +1,25 @@
 from cv2 import __version__ as cv2_version
-from cv2 import aruco, cvtColor, COLOR_RGB2GRAY, getPerspectiveTransform, perspectiveTransform # indispensable
-from cv2 import imwrite, polylines, line, putText, circle, warpPerspective, FONT_HERSHEY_DUPLEX # for debug image printing
-from cv2 import imread # used for tests
+from cv2 import aruco, cvtColor, COLOR_BGR2GRAY, getPerspectiveTransform, perspectiveTransform # indispensable
+from cv2 import resize, absdiff, INTER_AREA # pyramid detection and motion gating
+from cv2 import polylines, line, putText, circle, warpPerspective, FONT_HERSHEY_DUPLEX # for debug image printing
 from datetime import datetime # debug image printing
-from numpy import int32, int8, ravel, zeros, float32, mean, flip
-from os import system # clearing image folder
+from numpy import int32, int8, ravel, zeros, float32, mean, flip, clip, minimum, isin, arange, roll, median, floor, ceil, hstack, vstack
+from numpy import argwhere, argsort, intp, empty, bincount, count_nonzero, unique, delete, ravel_multi_index
+from numpy import stack, take_along_axis, where, array_equal, tril, ones
+from numpy.linalg import norm
+from collections import deque # board voting
+from concurrent.futures import ThreadPoolExecutor, Future # tile detection and background start
+from threading import Thread
+from scipy.optimize import linear_sum_assignment # pairs moved pieces of the same type
+from debug_image_writer import DebugImageWriter, clearDirectory
+from board_calibration import BoardCalibration, loadCalibration
+from marker_tracker import MarkerTracker
+from stage_timer import StageTimer
 from uci_string_generator import convertUCIPossibleMoves
 
 from picamera_camera import Camera
 #from opencv_camera import Camera
+from replay_camera import Camera as ReplayCamera # used for tests
 
 class BoardReader:
 	'''reads images from camera and translates to a chess board matrix with piece positions'''
@@ -29,82 +40,427 @@ class BoardReader:
 	}
 	'''maps aruco IDs to chess piece and color'''
 
-	def __init__(self, resolution = (1920, 1280), board_dimensions = (8, 12), write_steps = False, DEBUG_MODE = False, print_time = False):
+	piece_dtype = [('id', int32), ('center', int32, (2,))]
+	'''a chess piece detected in the image, with the center of its aruco in board (transformed) coordinates'''
+
+	move_dtype = [('id', int8), ('origin', int32, (2,)), ('destination', int32, (2,))]
+	'''a piece that moved between two boards, with the (rank, file) squares it moved from and to'''
+
+	def __init__(self, resolution = (1920, 1280), board_dimensions = (8, 12), write_steps = False, DEBUG_MODE = False, print_time = False,
+			roi_tracking = False, roi_margin = 0.1, detection_engine = "full", pyramid_scale = 0.5, homography_tolerance = 2,
+			debug_path = None, max_frame_age = None, camera_options = None,
+			motion_gating = False, gate_scale = 0.125, gate_pixel_threshold = 25, motion_threshold = 0.005, settle_frames = 1, vote_frames = 1,
+			tile_grid = (2, 2), tile_overlap = 160, tile_workers = 4, debug_image_options = None, timer = None, camera = None, background_start = False,
+			calibration_path = None, calibration_tolerance = 20, calibration_min_corners = 2, flow_tracking = False, flow_options = None):
 		self.resolution = int32(resolution)
 		self.board_dimensions = int32(board_dimensions)
 		self.write_steps = write_steps
 		self.DEBUG_MODE = DEBUG_MODE
 		self.print_time = print_time
+		# per stage latencies; print_time needs them measured even if no timer is shared with the reader
+		self.timer = timer if timer is not None else StageTimer(enabled = print_time)
+		self.roi_tracking = roi_tracking
+		self.roi_margin = roi_margin
+		self.last_detection_path = None
+		# with flow_tracking, arucos are followed with optical flow between full detections, see MarkerTracker
+		self.flow_tracking = flow_tracking
+		if self.flow_tracking:
+			self.marker_tracker = MarkerTracker(**(flow_options if flow_options is not None else {}))
+		self.detection_engine = detection_engine
+		self.pyramid_scale = pyramid_scale
+		self.tile_grid = tile_grid
+		self.tile_overlap = tile_overlap
+		if self.detection_engine == "tiles":
+			self.tile_executor = ThreadPoolExecutor(max_workers = tile_workers)
+		self.homography_tolerance = homography_tolerance
+		self.motion_gating = motion_gating
+		self.gate_scale = gate_scale
+		self.gate_pixel_threshold = gate_pixel_threshold
+		self.motion_threshold = motion_threshold
+		self.settle_frames = settle_frames
+		self.gate_frame = None
+		self.gate_previous_frame = None
+		self.gate_reference_frame = None
+		self.calm_frames = 0
+		self.last_gate_decision = None
+		self.recent_boards = deque(maxlen = vote_frames)
+
+		self.camera = camera
+		self.camera_resolution = resolution # the camera might round it, self.resolution is set to what it delivers once it is open
+		self.debug_path = debug_path
+		self.max_frame_age = max_frame_age
+		self.camera_options = camera_options if camera_options is not None else {}
+		# board corners saved by an earlier run, trusted once a frame shows some of the corners where they were
+		self.calibration_path = calibration_path
+		self.calibration_tolerance = calibration_tolerance
+		self.calibration_min_corners = calibration_min_corners
+		self.calibration = None
+
+		self.found_all_corners = False # in the last frame whose board corners were found
+
+		self.markers_found = 0
+		self.last_position_corners = None
+		self.homography = None
+		self.homography_corners = None
+		self.homography_cache_hits = 0
+		self.homography_cache_misses = 0
+		self.last_board = None
+		self.possible_moves = empty(0, dtype=BoardReader.move_dtype)
+
+		self.writing_frame = False # if the debug images of the current frame are being written
+		if self.write_steps:
+			debug_image_options = debug_image_options if debug_image_options is not None else {}
+			clearDirectory(debug_image_options.get("directory", "arucos")) # clears aruco image folder so we don't get images we already have through scp command
+			self.debug_writer = DebugImageWriter(**debug_image_options)
+			self.now = self._getTimeString() # gets current time string to use in image names
 
-		if self.DEBUG_MODE:
-			self.debug_path = None
+		# resolved once the camera is open and the board corners were found. With background_start, that happens on another thread
+		# and the constructor returns right away, but nothing else may be called before waitUntilReady returns
+		self.ready = Future()
+		if background_start:
+			thread = Thread(target=self.__startInBackground)
+			thread.daemon = True
+			thread.start()
 		else:
-			self.camera = Camera(resolution)
+			self._start()
+			self.ready.set_result(self)
+
+	def _start(self):
+		'''opens the camera, builds the aruco detectors and reads frames until the board corners are found'''
+		# color frames are only needed to draw the debug images
+		if self.camera is None and self.DEBUG_MODE:
+			# replays the image, image directory or video at debug_path, repeating it until the reader stops
+			self.camera = ReplayCamera(self.camera_resolution, self.debug_path, grayscale = not self.write_steps, max_frame_age = self.max_frame_age, loop = True, **self.camera_options)
+		elif self.camera is None:
+			self.camera = Camera(self.camera_resolution, grayscale = not self.write_steps, max_frame_age = self.max_frame_age, **self.camera_options)
 
-			self.resolution = self.camera.getRealResolution()
+		self.resolution = self.camera.getRealResolution()
 
 		if cv2_version == '4.7.0':
-			dictionary = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
-			self.arucoDetector = aruco.ArucoDetector(dictionary)
+			self.dictionary = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+			self.arucoDetector = aruco.ArucoDetector(self.dictionary)
+			self.coarseArucoDetector = aruco.ArucoDetector(self.dictionary, self._getCoarseDetectorParameters(aruco.DetectorParameters()))
 		else:
 			self.dictionary = aruco.Dictionary_get(aruco.DICT_4X4_50)
+			self.coarse_parameters = self._getCoarseDetectorParameters(aruco.DetectorParameters_create())
 
-		self.last_position_corners = None
-		self.last_board = None
-		self.possible_moves = []
-
-		system("rm arucos/*") # clears aruco image folder so we don't get images we already have through scp command
-		if self.write_steps:
-			self.now = self._getTimeString() # gets current time string to use in image names
+		self._loadCalibration()
 		self.updateBoard()
 		while self.last_position_corners is None:
 			self.updateBoard()
+		self._saveCalibration()
+
+	def _loadCalibration(self):
+		self.calibration = loadCalibration(self.calibration_path)
+		if self.calibration is None:
+			return
+		if not self.calibration.matchesResolution(self.resolution):
+			print(f"ignoring calibration made at {self.calibration.resolution}, camera resolution is {self.resolution}")
+			self.calibration = None
+			return
+		# the calibrated homography is kept for as long as the corners found stay within homography_tolerance of the calibrated ones
+		self.homography = self.calibration.homography
+		self.homography_corners = self.calibration.corners
+
+	def _saveCalibration(self):
+		'''saves the board corners and homography found at startup, unless they are the calibrated ones or some corners weren't seen'''
+		if self.calibration_path is None or not self.found_all_corners:
+			return
+		all_corners = ones(4, dtype=int32)
+		if self.calibration is not None and self.calibration.matchesCorners(all_corners, self.last_position_corners, self.homography_tolerance, 4):
+			return
+		self.calibration = BoardCalibration(self.resolution, self.last_position_corners, self.homography)
+		self.calibration.save(self.calibration_path)
+
+	def __startInBackground(self):
+		try:
+			self._start()
+			self.ready.set_result(self)
+		except Exception as error:
+			self.ready.set_exception(error)
+
+	def waitUntilReady(self, timeout = None):
+		'''blocks until the camera is open and the board corners were found, raising whatever kept the reader from starting.
+		Raises TimeoutError if that takes more than timeout seconds'''
+		self.ready.result(timeout)
+
+	def isReady(self) -> bool:
+		return self.ready.done() and self.ready.exception() is None
 
 	def _getTimeString(self):
-		if self.DEBUG_MODE and not self.debug_path is None:
-			return self.debug_path.split('/')[1]
-		else:
-			return datetime.now().strftime("%Y.%m.%d-%H:%M:%S")
+		return datetime.now().strftime("%Y.%m.%d-%H:%M:%S")
 
 	# for some reason detectMarkers returns a tuple of n arrays of dimension (1, 4, 2) when an (n, 4, 2) array is a lot more useful
 	def _formatArucoCornerArray(self, corners):
 		return int32(corners).reshape((len(corners), 4, 2))
 
-	def _detectArucos(self, img):
+	def _getCoarseDetectorParameters(self, parameters):
+		# markers that are barely big enough at full resolution get blurred below the minimum perimeter once downscaled
+		parameters.minMarkerPerimeterRate *= self.pyramid_scale
+		return parameters
+
+	def _getCropDetectorParameters(self, parameters, img, coarse):
+		# the marker perimeter limits are relative to the size of the image detectMarkers is given, so a crop of the frame would accept
+		# markers smaller than any real one (false detections in the background). They are scaled back to the size of the whole frame
+		frame_size = max(self.resolution) * (self.pyramid_scale if coarse else 1)
+		scale = frame_size / max(img.shape[:2])
+		parameters.minMarkerPerimeterRate *= scale
+		parameters.maxMarkerPerimeterRate *= scale
+		return parameters
+
+	def _runArucoDetector(self, img, coarse = False, crop = False):
+		'''detects arucos in the frame, in its downscaled copy if coarse, or in a crop of either if crop'''
+		if crop:
+			parameters = aruco.DetectorParameters() if cv2_version == '4.7.0' else aruco.DetectorParameters_create()
+			if coarse:
+				parameters = self._getCoarseDetectorParameters(parameters)
+			parameters = self._getCropDetectorParameters(parameters, img, coarse)
+			# building a detector takes about a microsecond, so one is built for every crop
+			if cv2_version == '4.7.0':
+				return aruco.ArucoDetector(self.dictionary, parameters).detectMarkers(img)
+			return aruco.detectMarkers(img, self.dictionary, parameters=parameters)
 		if cv2_version == '4.7.0':
-			corners, ids, _ = self.arucoDetector.detectMarkers(img)
+			detector = self.coarseArucoDetector if coarse else self.arucoDetector
+			return detector.detectMarkers(img)
+		elif coarse:
+			return aruco.detectMarkers(img, self.dictionary, parameters=self.coarse_parameters)
 		else:
-			corners, ids, _ = aruco.detectMarkers(img, self.dictionary)
+			return aruco.detectMarkers(img, self.dictionary)
+
+	def _detectArucos(self, img, crop = False):
+		'''detects arucos in the frame, or in a crop of it if crop, with the detection engine'''
+		if self.detection_engine == "pyramid":
+			return self._detectArucosPyramid(img, crop)
+		if self.detection_engine == "tiles":
+			return self._detectArucosTiles(img)
+		corners, ids, _ = self._runArucoDetector(img, crop = crop)
 		return corners, ids
 
-	def _getArucoCorners(self):
-		'''gets frame from camera and detects aruco codes, returning the coordinates of their corners'''
-		if self.DEBUG_MODE:
-			img = imread(self.debug_path)
-		else:
-			time = datetime.now()
-			img = self.camera.capture()
-			if self.print_time:
-				print(f"image read in {(datetime.now() - time).total_seconds()} seconds!")
+	def _filterCandidatesBySize(self, accepted, rejected):
+		'''drops rejected candidates whose mean side is far from the size of the markers that were accepted, since all markers on the board have the same physical size'''
+		if len(rejected) == 0 or len(accepted) == 0:
+			return rejected
+		accepted_sides = norm(accepted - roll(accepted, 1, axis=1), axis=2).mean(axis=1)
+		rejected_sides = norm(rejected - roll(rejected, 1, axis=1), axis=2).mean(axis=1)
+		typical_side = median(accepted_sides)
+		return rejected[(rejected_sides > typical_side / 2) & (rejected_sides < typical_side * 2)]
+
+	def _getCandidateRegions(self, candidates, img):
+		'''gets bounding boxes (x0, y0, x1, y1) in full resolution around each candidate found in the downscaled image, padded by half a marker so its quiet zone is kept'''
+		candidates = candidates / self.pyramid_scale
+		top_left = candidates.min(axis=1)
+		bottom_right = candidates.max(axis=1)
+		padding = (bottom_right - top_left).max(axis=1, keepdims=True) / 2
+		top_left = clip(floor(top_left - padding), 0, None)
+		bottom_right = minimum(ceil(bottom_right + padding), (img.shape[1], img.shape[0]))
+		return int32(hstack([top_left, bottom_right]))
+
+	def _mergeOverlappingRegions(self, regions):
+		'''merges overlapping boxes so no marker is decoded twice'''
+		merged = []
+		for region in regions.tolist():
+			i = 0
+			while i < len(merged):
+				other = merged[i]
+				if region[0] <= other[2] and other[0] <= region[2] and region[1] <= other[3] and other[1] <= region[3]:
+					region = [min(region[0], other[0]), min(region[1], other[1]), max(region[2], other[2]), max(region[3], other[3])]
+					del merged[i]
+					i = 0 # merged region might now overlap one we already checked
+				else:
+					i += 1
+			merged.append(region)
+		return merged
+
+	def _detectArucosPyramid(self, img, crop = False):
+		'''finds marker candidates on a downscaled copy of the image and decodes only those regions at full resolution'''
+		small = resize(img, None, fx=self.pyramid_scale, fy=self.pyramid_scale, interpolation=INTER_AREA)
+		corners, ids, rejected = self._runArucoDetector(small, coarse=True, crop=crop)
+
+		accepted = float32(corners).reshape((-1, 4, 2))
+		rejected = self._filterCandidatesBySize(accepted, float32(rejected).reshape((-1, 4, 2)))
+		candidates = vstack([accepted, rejected])
+
+		found_corners = []
+		found_ids = []
+		if len(candidates) > 0:
+			for x0, y0, x1, y1 in self._mergeOverlappingRegions(self._getCandidateRegions(candidates, img)):
+				region_corners, region_ids, _ = self._runArucoDetector(img[y0:y1, x0:x1], crop=True)
+				if region_ids is None:
+					continue
+				offset = float32([x0, y0])
+				found_corners += [corner + offset for corner in region_corners]
+				found_ids.append(region_ids)
+		found_ids = vstack(found_ids) if len(found_ids) > 0 else None
+
+		if not self._foundAllBoardCornerIDs(found_ids):
+			# a board corner was too small or blurry to show up in the downscaled image
+			corners, ids, _ = self._runArucoDetector(img, crop=crop)
+			return corners, ids
+
+		return tuple(found_corners), found_ids
+
+	def _getTiles(self, img):
+		'''splits the image in a tile_grid of regions (x0, y0, x1, y1), each extended by tile_overlap pixels into its neighbours.
+		The overlap must be bigger than the largest marker, so every marker is whole in at least one tile'''
+		columns, rows = self.tile_grid
+		x_edges = int32(arange(columns + 1) * img.shape[1] / columns)
+		y_edges = int32(arange(rows + 1) * img.shape[0] / rows)
+		half_overlap = self.tile_overlap // 2
+		tiles = []
+		for y0, y1 in zip(y_edges[:-1], y_edges[1:]):
+			for x0, x1 in zip(x_edges[:-1], x_edges[1:]):
+				tiles.append((max(x0 - half_overlap, 0), max(y0 - half_overlap, 0), min(x1 + half_overlap, img.shape[1]), min(y1 + half_overlap, img.shape[0])))
+		return tiles
+
+	def _removeDuplicateMarkers(self, corners, ids):
+		'''keeps only the first of the markers with the same ID whose centers are closer than half a marker side, as found in the overlap of two tiles'''
+		centers = corners.mean(axis=1)
+		sides = norm(corners - roll(corners, 1, axis=1), axis=2).mean(axis=1)
+		distances = norm(centers[:, None] - centers[None, :], axis=2)
+		same_marker = (ids[:, None] == ids[None, :]) & (distances < sides[:, None] / 2)
+		keep = ~tril(same_marker, -1).any(axis=1)
+		return corners[keep], ids[keep]
+
+	def _detectArucosTiles(self, img):
+		'''detects arucos in overlapping tiles of the image in parallel, merging the markers found in more than one tile'''
+		detect = lambda tile_img: self._runArucoDetector(tile_img, crop = True)
+		results = self.tile_executor.map(lambda tile: self._detectArucosInRegion(img, tile, detect), self._getTiles(img))
+
+		found_corners = []
+		found_ids = []
+		for corners, ids in results:
+			if ids is None:
+				continue
+			found_corners.append(float32(corners).reshape((-1, 4, 2)))
+			found_ids.append(ravel(ids))
+		if len(found_ids) == 0:
+			return (), None
+
+		corners, ids = self._removeDuplicateMarkers(vstack(found_corners), hstack(found_ids))
+		return tuple(corner[None] for corner in corners), ids.reshape((-1, 1))
+
+	def _getTrackingRegion(self, img):
+		'''gets the bounding box (x0, y0, x1, y1) of the board quad found in the last frame, expanded by roi_margin on every side'''
+		top_left = self.last_position_corners.min(axis=0)
+		bottom_right = self.last_position_corners.max(axis=0)
+		margin = int32((bottom_right - top_left).max() * self.roi_margin)
+		x0, y0 = clip(top_left - margin, 0, None)
+		x1, y1 = minimum(bottom_right + margin, (img.shape[1], img.shape[0]))
+		return x0, y0, x1, y1
+
+	def _detectArucosInRegion(self, img, region, detect):
+		'''detects arucos inside a crop of the image with detect, returning corners in the coordinates of the full image'''
+		x0, y0, x1, y1 = region
+		corners, ids = detect(img[y0:y1, x0:x1])[:2]
+		if ids is None:
+			return corners, ids
+		offset = float32([x0, y0])
+		corners = tuple(corner + offset for corner in corners)
+		return corners, ids
 
-		gray = cvtColor(img, COLOR_RGB2GRAY)
+	def _foundAllBoardCornerIDs(self, ids):
+		return ids is not None and isin(arange(4), ids).all()
+
+	def _detectArucosTracked(self, img):
+		'''detects arucos only around the board found in the last frame, falling back to the full frame when any board corner marker goes missing.
+		Also returns which of the two was used, see getLastDetectionPath'''
+		if self.roi_tracking and not self.last_position_corners is None:
+			corners, ids = self._detectArucosInRegion(img, self._getTrackingRegion(img), lambda region_img: self._detectArucos(region_img, crop = True))
+			if self._foundAllBoardCornerIDs(ids):
+				return corners, ids, "roi"
+
+		corners, ids = self._detectArucos(img)
+		return corners, ids, "full"
+
+	def _detectOrFollowArucos(self, img):
+		'''follows the arucos of the last frames with optical flow when flow_tracking is set, detecting them again when tracking gives up'''
+		if not self.flow_tracking:
+			return self._detectArucosTracked(img)
+
+		tracked = self.marker_tracker.track(img)
+		if tracked is not None:
+			return tracked + ("flow",)
+		corners, ids, detection_path = self._detectArucosTracked(img)
+		self.marker_tracker.start(img, corners, ids)
+		return corners, ids, detection_path
+
+	def _getChangedFraction(self, first, second):
+		'''fraction of the pixels whose luminance changed noticeably between two gate frames'''
+		if first.shape != second.shape:
+			return 1.0 # the camera resolution changed, so everything did
+		return count_nonzero(absdiff(first, second) > self.gate_pixel_threshold) / first.size
+
+	def _shouldReadFrame(self, gray):
+		'''compares a small copy of the frame with the previous frame and with the last frame the board was read from.
+		Frames are skipped while something (usually a hand) is moving over the board, or when nothing changed since the last read'''
+		self.gate_frame = resize(gray, None, fx=self.gate_scale, fy=self.gate_scale, interpolation=INTER_AREA)
+		previous_frame = self.gate_previous_frame
+		self.gate_previous_frame = self.gate_frame
+
+		if previous_frame is not None and self._getChangedFraction(self.gate_frame, previous_frame) > self.motion_threshold:
+			self.calm_frames = 0
+			self.last_gate_decision = "motion"
+			return False
+		self.calm_frames += 1
+
+		if self.gate_reference_frame is not None and self._getChangedFraction(self.gate_frame, self.gate_reference_frame) <= self.motion_threshold:
+			self.last_gate_decision = "static"
+			return False
+
+		if previous_frame is not None and self.calm_frames < self.settle_frames:
+			self.last_gate_decision = "settling"
+			return False
+
+		self.last_gate_decision = "read"
+		return True
 
-		if self.write_steps:
-			imwrite(f"arucos/{self.now}_RAW.png", img)
-		time = datetime.now()
-		corners, ids = self._detectArucos(gray)
+	def _captureFrame(self, min_seq = None):
+		'''gets a frame from the camera (see the camera's capture for min_seq), returning it and its luminance'''
+		with self.timer.measure("capture"):
+			img = self.camera.capture(min_seq)
+		if self.DEBUG_MODE and self.writing_frame:
+			self.now = self.camera.getFrameName() # debug images of replayed frames are named after the frame they came from
 		if self.print_time:
-			print(f"arucos read in {(datetime.now() - time).total_seconds()} seconds!")
+			print(f"image read in {self.timer.getLast('capture')} seconds!")
+
+		with self.timer.measure("gray_conversion"):
+			# cameras already deliver only the luminance when no debug images are written
+			gray = img if img.ndim == 2 else cvtColor(img, COLOR_BGR2GRAY)
+		return img, gray
+
+	def _detectArucoCorners(self, img, gray):
+		'''detects aruco codes in a frame, returning their ids and the coordinates of their corners, and the detection path used (see
+		getLastDetectionPath). It is run by several threads at once in BoardPipeline, so what it found is saved by _recordDetection'''
+		if self.writing_frame:
+			self.debug_writer.write(f"{self.now}_RAW", img)
+		with self.timer.measure("detection"):
+			corners, ids, detection_path = self._detectOrFollowArucos(gray)
+		if self.print_time:
+			print(f"arucos read in {self.timer.getLast('detection')} seconds! ({detection_path} frame)")
 
 		if ids is None:
-			return []
+			return [], detection_path
 
-		if self.write_steps:
+		if self.writing_frame:
 			self.img = img
 
-		ids = ravel(ids)
+		return [ravel(ids), self._formatArucoCornerArray(corners)], detection_path
+
+	def _recordDetection(self, ids_and_corners, detection_path):
+		'''saves how many arucos were found in the last frame detected and how, see getMarkersFound and getLastDetectionPath'''
+		self.markers_found = len(ids_and_corners[0]) if len(ids_and_corners) > 0 else 0
+		self.last_detection_path = detection_path
+
+	def _getArucoCorners(self):
+		'''gets frame from camera and detects aruco codes, returning the coordinates of their corners'''
+		img, gray = self._captureFrame()
 
-		return [ids, self._formatArucoCornerArray(corners)]
+		if self.motion_gating and not self._shouldReadFrame(gray):
+			return []
+
+		ids_and_corners, detection_path = self._detectArucoCorners(img, gray)
+		self._recordDetection(ids_and_corners, detection_path)
+		return ids_and_corners
 
 	def _showCornerNotFoundMessage(self, found_corner):
 		corners_found = sum(found_corner)
@@ -119,47 +475,61 @@ class BoardReader:
 			print("didn't find upper left corner!")
 
 	def _restoreLastFoundCorners(self, found_corner, corners):
-		for i in range(0, 4):
-			if found_corner[i] == 0:
-				corners[i] = self.last_position_corners[i]
+		missing = found_corner == 0
+		corners[missing] = self.last_position_corners[missing]
 		return corners
 
 	def _printImageWithBoardCorners(self, corners):
 		self.img = polylines(self.img, int32([corners]), True, (0, 255, 0), 5)
-		imwrite(f"arucos/{self.now}_BORDER.png", self.img)
+		self.debug_writer.write(f"{self.now}_BORDER", self.img)
 
 	def _checkFoundAllCorners(self, found_corner):
-		for corner in found_corner:
-			if corner == 0:
-				return False
-		return True
+		return found_corner.all()
+
+	def _matchesCalibration(self, found_corner, corners):
+		return self.calibration is not None and self.calibration.matchesCorners(found_corner, corners, self.calibration_tolerance, self.calibration_min_corners)
+
+	def _cornersMoved(self, found_corner, corners, reference_corners):
+		found = found_corner > 0
+		return found.any() and abs(corners[found] - reference_corners[found]).max() > self.calibration_tolerance
+
+	def _recoverMissingCorners(self, found_corner, corners):
+		'''fills in the board corners that weren't found: from where they were last found if the ones that were found didn't move, or from the
+		calibration at startup. Returns None if neither works'''
+		if self.last_position_corners is not None and not self._cornersMoved(found_corner, corners, self.last_position_corners):
+			print(f"restoring missing corners from {self.last_position_corners}")
+			return self._restoreLastFoundCorners(found_corner, corners)
+
+		if self.last_position_corners is None and self._matchesCalibration(found_corner, corners):
+			print("the corners found match the calibration, using it for the missing ones")
+			self.last_position_corners = self.calibration.corners.copy()
+			return self._restoreLastFoundCorners(found_corner, corners)
+
+		return None
 
 	def _getBoardCorners(self, ids_and_corners):
 		'''Gets coordinates of the four corners of the board'''
 		corners = zeros((4, 2), int32)
-		found_corner = [0] * 4
+		ids = ids_and_corners[0]
+		is_corner = ids <= 3
 
-		for i in range(len(ids_and_corners[0])):
-			id = ids_and_corners[0][i]
-			if 0 <= id and id <= 3:
-				found_corner[id] += 1
-				corners[id] = ids_and_corners[1][i][0]
+		found_corner = bincount(ids[is_corner], minlength=4)
+		# if a corner ID shows up more than once, the last detection wins
+		corners[ids[is_corner]] = ids_and_corners[1][is_corner, 0]
 
 		found_all_corners = self._checkFoundAllCorners(found_corner)
+		self.found_all_corners = found_all_corners
 
 		if not found_all_corners:
 			self._showCornerNotFoundMessage(found_corner)
-
-			if self.last_position_corners is None:
+			corners = self._recoverMissingCorners(found_corner, corners)
+			if corners is None:
 				print("can't find all points!")
 				return None
 
-			print(f"restoring missing corners from {self.last_position_corners}")
-			corners = self._restoreLastFoundCorners(found_corner, corners)
-
 		self.last_position_corners = corners
 
-		if self.write_steps:
+		if self.writing_frame:
 			self._printImageWithBoardCorners(corners)
 
 		return corners
@@ -180,16 +550,28 @@ class BoardReader:
 		second_point = tuple(int32([0, n*distance_between_lines]))
 		line(self.img, first_point, second_point, (255, 0, 0), 5)
 
+	def _boardCornersDrifted(self, board_corners):
+		return abs(int32(board_corners) - self.homography_corners).max() > self.homography_tolerance
+
+	def _getHomography(self, board_corners):
+		'''gets the matrix mapping the board to the image corners, only recalculating it when a board corner moved more than homography_tolerance pixels since it was last calculated'''
+		if self.homography is None or self._boardCornersDrifted(board_corners):
+			self.homography_cache_misses += 1
+			self.homography_corners = int32(board_corners)
+			self.homography = getPerspectiveTransform(float32(board_corners), self._getImageCorners())
+		else:
+			self.homography_cache_hits += 1
+		return self.homography
+
 	def _trasformPerspective(self, board_corners, ids_and_corners):
 		'''applies a perspective transformation to the corner cordinates mapping the corners of the board to the corners of the image'''
-		image_corners = self._getImageCorners()
-		matrix = getPerspectiveTransform(float32(board_corners), image_corners)
+		matrix = self._getHomography(board_corners)
 
-		if self.write_steps:
+		if self.writing_frame:
 			self.img = warpPerspective(self.img, matrix, self.resolution)
 			(vertical_distance_between_lines, horizontal_distance_between_lines) = self._getBoardSquareDimensions()
 
-			imwrite(f"arucos/{self.now}_TRANSFORM.png", self.img)
+			self.debug_writer.write(f"{self.now}_TRANSFORM", self.img)
 
 			for i in range(1, self.board_dimensions[0]):
 				self._drawNthHorizontalLine(horizontal_distance_between_lines, i)
@@ -197,7 +579,7 @@ class BoardReader:
 			for i in range(1, self.board_dimensions[1]):
 				self._drawNthVerticalLine(vertical_distance_between_lines, i)
 
-			imwrite(f"arucos/{self.now}_BOARD.png", self.img)
+			self.debug_writer.write(f"{self.now}_BOARD", self.img)
 
 		ids_and_corners[1] = perspectiveTransform(float32(ids_and_corners[1]), matrix)
 
@@ -212,144 +594,193 @@ class BoardReader:
 		self.img = circle(self.img, center, 1, color, 5)
 
 	def _getPieceCenters(self, ids_and_corners):
-		'''gets the center of each chess piece identified in the image'''
-		filtered_ids = []
-		piece_centers = []
+		'''gets the center of each chess piece identified in the image, as an array of piece_dtype'''
 		ids = ids_and_corners[0]
 		centers = mean(ids_and_corners[1], axis=1)
 
-		for i in range(len(ids)):
-			id = ids[i]
-			center = centers[i]
-			if id < 4:
-				continue
-
-			if id <= 15:
-				filtered_ids.append(id)
-				piece_centers.append(center)
-			else:
-				print(f"unexpected ID {id} at coordinates {center}")
+		is_piece = (4 <= ids) & (ids <= 15)
+		is_unexpected = ids > 15
+		for id, center in zip(ids[is_unexpected], centers[is_unexpected]):
+			print(f"unexpected ID {id} at coordinates {center}")
 
-			if self.write_steps:
+		if self.writing_frame:
+			for id, center in zip(ids[ids >= 4], centers[ids >= 4]):
 				self._drawArucoCenterAndWriteID(id, center)
+			self.debug_writer.write(f"{self.now}_PIECES", self.img)
 
-		if self.write_steps:
-			imwrite(f"arucos/{self.now}_PIECES.png", self.img)
-		return [filtered_ids, int32(piece_centers)]
+		pieces = empty(count_nonzero(is_piece), dtype=BoardReader.piece_dtype)
+		pieces['id'] = ids[is_piece]
+		pieces['center'] = centers[is_piece]
+		return pieces
 
 	def _calculatePieceCoordinates(self, centers):
 		square_size = self._getBoardSquareDimensions()
-		coordinates = flip(int8(centers / square_size), axis=1)
+		coordinates = flip(int32(centers / square_size), axis=1)
 		return coordinates
 
-	def _isPieceOutOfBoard(self, piece_position):
-		return piece_position[0] > self.board_dimensions[0] or piece_position[1] > self.board_dimensions[1]
+	def _isPieceOutOfBoard(self, coordinates):
+		return (coordinates < 0).any(axis=1) | (coordinates >= self.board_dimensions).any(axis=1)
+
+	def _showOutOfBoardMessages(self, pieces, coordinates):
+		for id, coord in zip(pieces['id'], coordinates):
+			print(f"piece {BoardReader.piece_types[id]} at coordinates {tuple(coord)} out of board with dimensions {tuple(self.board_dimensions)}")
 
-	def _generateBoard(self, piece_centers):
+	def _showDuplicateMessages(self, ids, squares):
+		for id, square in zip(ids, squares):
+			print(f"position {tuple(square)} has two pieces of type {BoardReader.piece_types[id]}! - treating piece as duplicate")
+
+	def _showCollisionMessages(self, ids, squares, first_ids):
+		for id, square, first_id in zip(ids, squares, first_ids):
+			print(f"position {tuple(square)} has pieces {BoardReader.piece_types.get(first_id, '?')} and {BoardReader.piece_types[id]}!")
+
+	def _generateBoard(self, pieces):
+		'''places each piece in the square its center falls in. When a square already has a piece, a piece of the type it holds is dropped as a
+		duplicate, and a different one is encoded as what the square holds * 100 + id (wrapping around like the int8 board does)'''
 		board = zeros(self.board_dimensions, dtype = int8)
 		real_positions = zeros((self.board_dimensions[0], self.board_dimensions[1], 2), dtype = int32)
-		ids = piece_centers[0]
-		if len(ids) == 0:
+		if len(pieces) == 0:
 			return board, real_positions
-		coordinates = self._calculatePieceCoordinates(piece_centers[1])
-
-		for i in range(len(ids)):
-			id = ids[i]
-			coord = coordinates[i]
-			center = piece_centers[1][i]
-			if self._isPieceOutOfBoard(coord):
-				print(f"piece {BoardReader.piece_types[id]} at coordinates {tuple(coord)} out of board with dimensions {tuple(coord)}")
-				continue
-			if board[coord[0]][coord[1]] != 0:
-				if board[coord[0]][coord[1]] == id:
-					print(f"position {coord} has two pieces of type {BoardReader.piece_types[id]}! - treating piece as duplicate")
-				else:
-					print(f"position {coord} has pieces {BoardReader.piece_types[board[coord[0]][coord[1]]]} and {BoardReader.piece_types[id]}!")
-					board[coord[0]][coord[1]] *= 100
-					board[coord[0]][coord[1]] += id
-				continue
-			board[coord[0]][coord[1]] = id
-			real_positions[coord[0]][coord[1]] = center
+		coordinates = self._calculatePieceCoordinates(pieces['center'])
+
+		out_of_board = self._isPieceOutOfBoard(coordinates)
+		if out_of_board.any():
+			self._showOutOfBoardMessages(pieces[out_of_board], coordinates[out_of_board])
+			pieces = pieces[~out_of_board]
+			coordinates = coordinates[~out_of_board]
+
+		squares = ravel_multi_index(coordinates.T, self.board_dimensions)
+
+		encoded = zeros(board.size, dtype=int32)
+		flat_real_positions = real_positions.reshape((-1, 2))
+		# each round takes the earliest remaining piece of every square, so a square with n pieces is filled in n rounds, in detection order
+		remaining = arange(len(squares))
+		while len(remaining) > 0:
+			_, round_indices = unique(squares[remaining], return_index=True)
+			current = remaining[round_indices]
+			current_squares = squares[current]
+			current_ids = pieces['id'][current]
+			square_ids = encoded[current_squares]
+			empty_square = square_ids == 0
+			duplicate = square_ids == current_ids
+			collision = ~empty_square & ~duplicate
+
+			encoded[current_squares[empty_square]] = current_ids[empty_square]
+			flat_real_positions[current_squares[empty_square]] = pieces['center'][current[empty_square]]
+			if duplicate.any():
+				self._showDuplicateMessages(current_ids[duplicate], coordinates[current[duplicate]])
+			if collision.any():
+				self._showCollisionMessages(current_ids[collision], coordinates[current[collision]], square_ids[collision])
+				# wrapped to int8 right away, since the next piece in the square is compared with what the int8 board would hold
+				encoded[current_squares[collision]] = (square_ids[collision] * 100 + current_ids[collision] + 128) % 256 - 128
+			remaining = delete(remaining, round_indices)
+
+		board = encoded.astype(int8).reshape(self.board_dimensions)
 		board = flip(board, axis=0)
 		return board, real_positions
+
+	# the predicates below work element-wise on whole boards
 	def _emptyOrInvalid(self, id):
-		return id < 4 or 15 < id
+		return (id < 4) | (15 < id)
 
 	def _isNewPieceInPosition(self, last_id, new_id):
-		return self._emptyOrInvalid(last_id) and new_id > 0
+		return self._emptyOrInvalid(last_id) & (new_id > 0)
 
 	def _isPieceNoLongerInPosition(self, last_id, new_id):
-		return last_id > 0 and self._emptyOrInvalid(new_id)
+		return (last_id > 0) & self._emptyOrInvalid(new_id)
 
 	def _isDifferentPieceInPosition(self, last_id, new_id):
 		return last_id != new_id
 
 	def _calculateDifferencesBetweenBoards(self, last_board, new_board):
-		pieces_not_in_last_position = []
-		pieces_in_new_position = []
-
-		for i in range(new_board.shape[0]):
-			for j in range(new_board.shape[1]):
-				last_piece_id = last_board[i][j]
-				new_piece_id = new_board[i][j]
-				if self._isNewPieceInPosition(last_piece_id, new_piece_id):
-					pieces_in_new_position.append((new_piece_id, (i, j)))
-				elif self._isPieceNoLongerInPosition(last_piece_id, new_piece_id):
-					pieces_not_in_last_position.append((last_piece_id, (i, j)))
-				elif self._isDifferentPieceInPosition(last_piece_id, new_piece_id):
-					pieces_in_new_position.append((new_piece_id, (i, j)))
-					pieces_not_in_last_position.append((last_piece_id, (i, j)))
-
-		return pieces_not_in_last_position, pieces_in_new_position
-
-	def _restoreMissingPieces(self, board, missing_pieces):
-		for id, position in missing_pieces:
-			if board[position[0]][position[1]] == 0:
-				board[position[0]][position[1]] = id
+		'''compares the boards square by square, returning the (rank, file) indices of the squares a piece vanished from and of the squares a piece appeared in.
+		A square whose piece was replaced by a different one is in both'''
+		appeared = self._isNewPieceInPosition(last_board, new_board)
+		vanished = ~appeared & self._isPieceNoLongerInPosition(last_board, new_board)
+		changed = ~(appeared | vanished) & self._isDifferentPieceInPosition(last_board, new_board)
+
+		return argwhere(vanished | changed), argwhere(appeared | changed)
+
+	def _restoreMissingPieces(self, board, last_board, missing_squares):
+		'''puts back pieces from the last board in the given squares, if nothing else is there now'''
+		missing = zeros(board.shape, dtype=bool)
+		missing[tuple(missing_squares.T)] = True
+		missing &= board == 0
+		board[missing] = last_board[missing]
 		return board
 
-	def _searchPossibleMovements(self, pieces_in_new_position, pieces_not_in_last_position):
-		pieces_moved = []
-		len_new_pieces = len(pieces_in_new_position)
-		len_not_in_last_position_pieces = len(pieces_not_in_last_position)
-		i = 0
-		while i < len_new_pieces:
-			j = i
-			new_piece = pieces_in_new_position[i]
-			found = False
-			while j < len_not_in_last_position_pieces:
-				old_piece = pieces_not_in_last_position[j]
-				if new_piece[0] == old_piece[0]:
-					pieces_moved.append((new_piece[0], old_piece[1], new_piece[1]))
-					del pieces_in_new_position[i]
-					del pieces_not_in_last_position[j]
-					len_new_pieces -= 1
-					len_not_in_last_position_pieces -= 1
-					found = True
-					break
-				j += 1
-			if not found:
-				i += 1
-
-		return pieces_moved, pieces_not_in_last_position, pieces_in_new_position
+	def _groupSquaresByPiece(self, board, squares):
+		'''maps each valid piece ID to the indices (in squares) of the squares holding a piece of that type'''
+		groups = {}
+		for index, id in enumerate(board[tuple(squares.T)].tolist()):
+			if not self._emptyOrInvalid(id):
+				groups.setdefault(id, []).append(index)
+		return groups
+
+	def _searchPossibleMovements(self, last_board, board, vanished_squares, appeared_squares):
+		'''pairs squares pieces vanished from with squares a piece of the same type appeared in. When several pieces of one type moved,
+		the pairs are chosen so the total distance moved is minimal. Returns the moves as an array of move_dtype, and the unpaired squares'''
+		vanished_by_id = self._groupSquaresByPiece(last_board, vanished_squares)
+		appeared_by_id = self._groupSquaresByPiece(board, appeared_squares)
+
+		paired_vanished = []
+		paired_appeared = []
+		for id in vanished_by_id.keys() & appeared_by_id.keys():
+			origins = vanished_by_id[id]
+			destinations = appeared_by_id[id]
+			distances = norm(vanished_squares[origins][:, None] - appeared_squares[destinations][None, :], axis=2)
+			origin_indices, destination_indices = linear_sum_assignment(distances)
+			paired_vanished += [origins[i] for i in origin_indices]
+			paired_appeared += [destinations[i] for i in destination_indices]
+
+		order = argsort(paired_appeared) # moves are listed in board order of their destinations
+		paired_vanished = intp(paired_vanished)[order]
+		paired_appeared = intp(paired_appeared)[order]
+
+		pieces_moved = empty(len(order), dtype=BoardReader.move_dtype)
+		pieces_moved['id'] = board[tuple(appeared_squares[paired_appeared].T)]
+		pieces_moved['origin'] = vanished_squares[paired_vanished]
+		pieces_moved['destination'] = appeared_squares[paired_appeared]
+
+		return pieces_moved, delete(vanished_squares, paired_vanished, axis=0), delete(appeared_squares, paired_appeared, axis=0)
 
 	def _verifyBoardAndSearchPossibleMovements(self, board, last_board):
 		if board.shape != last_board.shape:
-			return board
+			return board, empty(0, dtype=BoardReader.move_dtype)
 
-		pieces_not_in_last_position, pieces_in_new_position = self._calculateDifferencesBetweenBoards(last_board, board)
-		pieces_moved, pieces_not_in_last_position, pieces_in_new_position = self._searchPossibleMovements(pieces_in_new_position, pieces_not_in_last_position)
+		vanished_squares, appeared_squares = self._calculateDifferencesBetweenBoards(last_board, board)
+		pieces_moved, missing_squares, _ = self._searchPossibleMovements(last_board, board, vanished_squares, appeared_squares)
 
 		if len(pieces_moved) > 2:
 			print("too many moved pieces!")
 			for id, old_position, new_position in pieces_moved:
-				print(f"chess piece {BoardReader.piece_types[id]} moved from {old_position} to {new_position}")
+				print(f"chess piece {BoardReader.piece_types[id]} moved from {tuple(old_position)} to {tuple(new_position)}")
 
 		# assumes pieces that we "lost" are in the same place, if there are not other pieces there
 
-		board = self._restoreMissingPieces(board, pieces_not_in_last_position)
+		board = self._restoreMissingPieces(board, last_board, missing_squares)
 		return board, pieces_moved
 
+	def _voteBoard(self, board):
+		'''adds the board to the last vote_frames boards read and returns, for each square, the value seen in more than half of them.
+		Squares without a majority keep their value from the last board, so a detection that flickers for a frame doesn't become a move'''
+		self.recent_boards.append(board)
+		if len(self.recent_boards) == 1:
+			return board
+
+		boards = stack(self.recent_boards)[::-1] # newest first, so ties go to the most recent value
+		agreement = (boards[:, None] == boards[None, :]).sum(axis=1) # how many boards agree with each board, square by square
+		best = agreement.argmax(axis=0)[None]
+		voted = take_along_axis(boards, best, axis=0)[0]
+		has_majority = take_along_axis(agreement, best, axis=0)[0] * 2 > len(boards)
+
+		if self.last_board is None:
+			return voted
+		return where(has_majority, voted, self.last_board)
+
+	def _boardVotesSettled(self):
+		'''True when all the boards being voted on are identical'''
+		return len(self.recent_boards) == self.recent_boards.maxlen and all(array_equal(board, self.recent_boards[0]) for board in self.recent_boards)
+
 	def printBoard(self, board: int8):
 		'''pretty prints the chess board matrix'''
 		for i in range(board.shape[0] - 1, -1, -1):
@@ -367,43 +798,97 @@ class BoardReader:
 					line += '?'
 			print(line)
 
-	def updateBoard(self):
-		if self.write_steps:
-			self.now = self._getTimeString()
-
-		ids_and_corners = self._getArucoCorners()
+	def _interpretArucoCorners(self, ids_and_corners, gate_frame):
+		'''turns the arucos detected in a frame into a board, updating the last board and the possible moves'''
 		if len(ids_and_corners) == 0:
 			return
-		board_corners = self._getBoardCorners(ids_and_corners)
+		with self.timer.measure("corner_resolution"):
+			board_corners = self._getBoardCorners(ids_and_corners)
 
 		if board_corners is None:
 			return
 
-		ids_and_transformed_corners = self._trasformPerspective(board_corners, ids_and_corners)
+		with self.timer.measure("transform"):
+			ids_and_transformed_corners = self._trasformPerspective(board_corners, ids_and_corners)
+
+		with self.timer.measure("grid"):
+			piece_centers = self._getPieceCenters(ids_and_transformed_corners)
+
+			board, self.real_positions = self._generateBoard(piece_centers)
+			board = self._voteBoard(board)
 
-		piece_centers = self._getPieceCenters(ids_and_transformed_corners)
+		with self.timer.measure("diff"):
+			if not self.last_board is None:
+				board, self.possible_moves = self._verifyBoardAndSearchPossibleMovements(board, self.last_board)
+			self.last_board = board
 
-		board, self.real_positions = self._generateBoard(piece_centers)
+		if self.motion_gating and self._boardVotesSettled():
+			# later frames are compared to this one to know if the board needs to be read again
+			self.gate_reference_frame = gate_frame
 
-		if not self.last_board is None:
-			board, self.possible_moves = self._verifyBoardAndSearchPossibleMovements(board, self.last_board)
-		self.last_board = board
+	def updateBoard(self):
+		if self.write_steps:
+			self.now = self._getTimeString()
+			self.writing_frame = self.debug_writer.sampleFrame()
+
+		ids_and_corners = self._getArucoCorners()
+		self._interpretArucoCorners(ids_and_corners, self.gate_frame)
 
 	def updateBoardGetMoves(self) -> list[str]:
 		self.updateBoard()
-		uci_moves = convertUCIPossibleMoves(self.possible_moves)
-		self.possible_moves.clear()
+		with self.timer.measure("uci_conversion"):
+			uci_moves = convertUCIPossibleMoves(self.possible_moves)
+		self.possible_moves = empty(0, dtype=BoardReader.move_dtype)
 		return uci_moves
 
 	def getBoard(self) -> int8:
 		return self.last_board
 
+	def resetTracking(self):
+		'''forgets everything learned from previous frames (board corners, homography, boards, motion gate), as if the reader was just created'''
+		self.last_position_corners = None
+		self.homography = None
+		self.homography_corners = None
+		self.last_board = None
+		self.recent_boards.clear()
+		self.possible_moves = empty(0, dtype=BoardReader.move_dtype)
+		self.gate_previous_frame = None
+		self.gate_reference_frame = None
+		self.calm_frames = 0
+		if self.flow_tracking:
+			self.marker_tracker.stop()
+
+	def getMarkersFound(self) -> int:
+		'''returns how many arucos were detected in the last frame read'''
+		return self.markers_found
+
+	def getTimings(self) -> dict:
+		'''returns the latency percentiles of each stage of updateBoard, see StageTimer.getSnapshot'''
+		return self.timer.getSnapshot()
+
+	def getHomographyCacheStats(self) -> tuple[int, int]:
+		'''returns how many frames reused the cached homography and how many had to recalculate it, in that order'''
+		return self.homography_cache_hits, self.homography_cache_misses
+
+	def getLastGateDecision(self) -> str:
+		'''returns why the motion gate let the last frame through or skipped it: "read", "motion", "settling" or "static"'''
+		return self.last_gate_decision
+
+	def isSceneMoving(self) -> bool:
+		'''returns True if the last frame was skipped because something is moving over the board, or hasn't settled yet'''
+		return self.motion_gating and self.last_gate_decision in ("motion", "settling")
+
+	def getLastDetectionPath(self) -> str:
+		'''returns "roi" if the last frame was read only around the tracked board, "flow" if its arucos were followed from the last frames
+		with optical flow, or "full" if the whole frame was searched'''
+		return self.last_detection_path
+
 	def getPieceRealPositionsMillimeters(self) -> int32:
 		self.updateBoard()
 		return self.real_positions
 
 if __name__ == "__main__":
-	reader = BoardReader(write_steps = True, DEBUG_MODE=True)
+	reader = BoardReader(write_steps = True, DEBUG_MODE=True, debug_path="test_image_real.png")
 	reader.updateBoard()
 	board = reader.getBoard()
 	if board is None:
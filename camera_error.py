@@ -0,0 +1,5 @@
+class CameraError(Exception):
+	'''raised by the camera backends when frames can't be captured'''
+
+class ReplayFinished(CameraError):
+	'''raised by the replay camera once every recorded frame was delivered'''
@@ -0,0 +1,82 @@
+from cv2 import imwrite, IMWRITE_PNG_COMPRESSION, IMWRITE_JPEG_QUALITY
+from os import makedirs, remove, scandir
+from queue import Queue, Full
+from threading import Thread
+from weakref import WeakSet
+from atexit import register
+
+def clearDirectory(directory):
+	'''removes every file in the directory, creating it if it doesn't exist'''
+	makedirs(directory, exist_ok = True)
+	for entry in scandir(directory):
+		if entry.is_file():
+			remove(entry.path)
+
+# writers still writing when the interpreter exits are closed first, since killing a thread inside OpenCV aborts the process
+_open_writers = WeakSet()
+
+@register
+def _closeOpenWriters():
+	for writer in list(_open_writers):
+		writer.close()
+
+class DebugImageWriter:
+	'''writes debug images on a background thread, so encoding them doesn't add to the latency of each frame.
+	Only one in every sample_every frames is written, and images are dropped instead of waiting when queue_size images are already waiting to be written'''
+
+	def __init__(self, directory = "arucos", image_format = "png", png_compression = 1, jpeg_quality = 90, sample_every = 1, queue_size = 8):
+		self.directory = directory
+		self.image_format = image_format
+		if image_format == "png":
+			self.parameters = [IMWRITE_PNG_COMPRESSION, png_compression]
+		elif image_format == "jpg":
+			self.parameters = [IMWRITE_JPEG_QUALITY, jpeg_quality]
+		else:
+			raise ValueError(f"unsupported debug image format {image_format}, use png or jpg")
+		self.sample_every = sample_every
+		self.frames_seen = 0
+		self.dropped = 0
+		self.queue = Queue(maxsize = queue_size)
+		self.closed = False
+		self.thread = Thread(target=self.__write)
+		self.thread.daemon = True
+		self.thread.start()
+		_open_writers.add(self)
+
+	def sampleFrame(self) -> bool:
+		'''called once per frame, returns True if this frame's debug images should be drawn and written'''
+		self.frames_seen += 1
+		return (self.frames_seen - 1) % self.sample_every == 0
+
+	def write(self, name, img):
+		'''queues a copy of the image to be written as <directory>/<name>.<format>, since callers keep drawing on the same image'''
+		if self.closed or self.queue.full():
+			self.dropped += 1
+			return
+		try:
+			self.queue.put_nowait((name, img.copy()))
+		except Full:
+			self.dropped += 1
+
+	def flush(self):
+		'''blocks until every queued image was written'''
+		self.queue.join()
+
+	def close(self):
+		'''writes the images still queued and stops the writer thread. Images written after closing are dropped'''
+		if self.closed:
+			return
+		self.closed = True
+		self.queue.put(None)
+		self.thread.join()
+		_open_writers.discard(self)
+
+	def __write(self):
+		while (image := self.queue.get()) is not None:
+			name, img = image
+			try:
+				imwrite(f"{self.directory}/{name}.{self.image_format}", img, self.parameters)
+			except Exception as error:
+				print(f"failed to write debug image {name}: {error}")
+			self.queue.task_done()
+		self.queue.task_done() # the None close() queued
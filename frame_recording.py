@@ -0,0 +1,138 @@
+from numpy import uint8, load, memmap
+from numpy.lib.format import open_memmap, write_array_header_1_0
+from datetime import datetime
+from json import dump, load as load_json
+from os.path import splitext
+from threading import Lock
+
+def getIndexPath(path):
+	'''returns the path of the sidecar index of a recording, session.npy -> session.json'''
+	return splitext(path)[0] + ".json"
+
+class FrameRecorder:
+	'''records raw frames into a .npy file mapped in memory, so recording a frame is a copy into the page cache instead of an
+	image encoding. It is meant to be called from the camera thread, see the recorder option of the camera backends.
+	The file is created with the shape of the first frame and grows chunk_frames frames at a time, up to max_frames frames (600 grayscale
+	1920x1088 frames take 1.25 GB), and frames after that are dropped. close() shrinks it to the frames that were recorded.
+	The sidecar index (see getIndexPath) keeps how many frames were recorded, their resolution and timestamps, and is written by flush and close'''
+
+	def __init__(self, path, max_frames = 600, chunk_frames = 50, flush_every = 100):
+		self.path = path
+		self.max_frames = max_frames
+		self.chunk_frames = chunk_frames
+		self.flush_every = flush_every
+		self.frames = None
+		self.frame_shape = None
+		self.timestamps = []
+		self.dropped = 0
+		self.started = datetime.now().isoformat(timespec = "seconds")
+		self.lock = Lock()
+
+	def record(self, img, timestamp):
+		'''copies the frame into the recording, with the time (in time.monotonic() seconds) it was captured'''
+		with self.lock:
+			if self.frame_shape is None:
+				self.frame_shape = img.shape
+				self.frames = open_memmap(self.path, mode = "w+", dtype = uint8, shape = (min(self.chunk_frames, self.max_frames),) + img.shape)
+				self.offset = self.frames.offset
+				self.frame_size = img.size
+			if len(self.timestamps) == self.max_frames or img.shape != self.frame_shape:
+				self.dropped += 1
+				return
+			if len(self.timestamps) == len(self.frames):
+				frames = min(len(self.frames) + self.chunk_frames, self.max_frames)
+				self.__resize(frames)
+				self.frames = memmap(self.path, dtype = uint8, mode = "r+", offset = self.offset, shape = (frames,) + self.frame_shape)
+			self.frames[len(self.timestamps)] = img
+			self.timestamps.append(timestamp)
+			if len(self.timestamps) % self.flush_every == 0:
+				self.__flush()
+
+	def __resize(self, frames):
+		'''changes the file to hold this many frames, unmapping it'''
+		self.frames.flush()
+		self.frames = None
+		with open(self.path, "r+b") as f:
+			# numpy pads the header so the length of the first axis can be rewritten in place
+			write_array_header_1_0(f, {"descr": "|u1", "fortran_order": False, "shape": (frames,) + self.frame_shape})
+			if f.tell() != self.offset:
+				raise ValueError(f"the header of {self.path} can't be rewritten in place")
+			f.truncate(self.offset + frames * self.frame_size)
+
+	def __flush(self):
+		if self.frames is None:
+			return
+		self.frames.flush()
+		index = {
+			"frames": len(self.timestamps),
+			"resolution": [self.frame_shape[1], self.frame_shape[0]],
+			"channels": self.frame_shape[2] if len(self.frame_shape) == 3 else 1,
+			"started": self.started,
+			"dropped": self.dropped,
+			"timestamps": self.timestamps,
+		}
+		with open(getIndexPath(self.path), "w") as f:
+			dump(index, f)
+
+	def flush(self):
+		'''writes the recorded frames and the index to disk, so everything recorded so far can be replayed even if the program dies'''
+		with self.lock:
+			self.__flush()
+
+	def close(self):
+		with self.lock:
+			self.__flush()
+			if self.frames is not None and len(self.frames) > len(self.timestamps):
+				self.__resize(len(self.timestamps))
+			self.frames = None
+
+	def getFrameCount(self):
+		return len(self.timestamps)
+
+class FrameRecording:
+	'''reads a recording made by FrameRecorder. Frames are views of the file mapped in memory (copy on write, so they can be drawn on
+	without changing the file), so reading them copies and decodes nothing'''
+
+	def __init__(self, path):
+		self.path = path
+		with open(getIndexPath(path)) as f:
+			index = load_json(f)
+		self.resolution = tuple(index["resolution"])
+		self.timestamps = index["timestamps"]
+		self.frames = load(path, mmap_mode = "c")[:index["frames"]]
+
+	def __len__(self):
+		return len(self.frames)
+
+	def __getitem__(self, i):
+		return self.frames[i]
+
+	def getTimestamp(self, i):
+		'''returns when (in time.monotonic() seconds of the recording session) frame i was captured'''
+		return self.timestamps[i]
+
+if __name__ == "__main__":
+	# records a session from the camera, to be replayed with the replay camera
+	from picamera_camera import Camera
+	from argparse import ArgumentParser
+	from time import sleep
+
+	parser = ArgumentParser(description = "records raw camera frames into a memory mapped .npy file and its sidecar index")
+	parser.add_argument("path")
+	parser.add_argument("--frames", type = int, default = 600)
+	parser.add_argument("--resolution", default = "1920x1088", help = "WIDTHxHEIGHT")
+	parser.add_argument("--framerate", type = int, default = 1)
+	parser.add_argument("--color", action = "store_true", help = "records BGR frames instead of only the luminance")
+	arguments = parser.parse_args()
+
+	recorder = FrameRecorder(arguments.path, max_frames = arguments.frames)
+	resolution = tuple(int(size) for size in arguments.resolution.split("x"))
+	camera = Camera(resolution, grayscale = not arguments.color, streaming = True, framerate = arguments.framerate, recorder = recorder)
+	try:
+		while recorder.getFrameCount() < arguments.frames:
+			sleep(1)
+			print(f"recorded {recorder.getFrameCount()} of {arguments.frames} frames")
+	finally:
+		# the camera thread records into the recorder, so it is stopped first
+		camera.close()
+		recorder.close()
@@ -1,16 +1,12 @@
 from __future__ import annotations
-from typing import Any
+from time import perf_counter
+process_started = perf_counter() # the startup report counts from here
 
-import berserk
 import chess
 import random
 import states
-from board_reader import BoardReader
-from board_comparator import boardPiecePositionsIdentical
-from display import Display
-from encoder import setupEncoder, selectOptionEncoder
-from time import sleep
-import serial
+from stage_timer import StageTimer
+# the vision, serial, display and lichess modules are slow to import and their devices slow to open, so they are only loaded on first use
 
 def atoi(value: any, default: int = 0) -> int:
 	try:
@@ -18,37 +14,116 @@ def atoi(value: any, default: int = 0) -> int:
 	except ValueError:
 		return default
 
-with open("./.lichess.token") as f:
-	token = f.read()
-
-session = berserk.TokenSession(token=token)
-client = berserk.Client(session)
-
 UsePhysicalBoard = False
 UseDisplay = True
+MeasureTimes = False
+timer = StageTimer(enabled = MeasureTimes) # shared with the board reader, so one snapshot covers vision and lichess round trips
+client = None
 reader = None
 display = None
 encoder = None
-ser = serial.Serial("/dev/ttyS0", 9600)
+ser = None
+startup_times = {} # how long each subsystem took to load, in seconds
+
+def initialize_subsystem(name: str, create):
+	start = perf_counter()
+	subsystem = create()
+	startup_times[name] = perf_counter() - start
+	timer.record(f"startup_{name}", startup_times[name])
+	return subsystem
+
+def create_client(base_url: str | None = None, token: str | None = None):
+	'''creates a lichess client, by default on lichess.org with the token in .lichess.token. See lichess_stand_in.py for a local server'''
+	import berserk
+	if token is None:
+		with open("./.lichess.token") as f:
+			token = f.read()
+	session = berserk.TokenSession(token=token)
+	return berserk.Client(session, base_url=base_url)
+
+def get_client():
+	global client
+	if client is None:
+		client = initialize_subsystem("lichess_client", create_client)
+	return client
+
+def create_reader():
+	from board_reader import BoardReader
+	# the camera is opened and the board corners looked for on a background thread, see get_reader
+	return BoardReader(resolution = (1920, 1296), motion_gating = True, vote_frames = 3, timer = timer, background_start = True, calibration_path = "calibration.json")
+
+def start_vision():
+	'''starts opening the camera and looking for the board, without waiting for it, so it happens while the menu is shown'''
+	global reader
+	if reader is None:
+		reader = initialize_subsystem("vision", create_reader)
+
+def get_reader():
+	'''returns the board reader, waiting until it found the board if it is still starting'''
+	start_vision()
+	if not reader.isReady():
+		print("initializing autoMCS computer vision module, please wait...")
+		with timer.measure("vision_ready_wait"):
+			reader.waitUntilReady()
+	return reader
+
+def create_serial():
+	import serial
+	return serial.Serial("/dev/ttyS0", 9600)
+
+def get_serial():
+	global ser
+	if ser is None:
+		ser = initialize_subsystem("serial", create_serial)
+	return ser
+
+def create_display():
+	from display import Display
+	display = Display()
+	display.drawTitle()
+	return display
+
+def get_display():
+	global display
+	if display is None:
+		display = initialize_subsystem("display", create_display)
+	return display
+
+def create_encoder():
+	from encoder import setupEncoder
+	return setupEncoder()
+
+def get_encoder():
+	global encoder
+	if encoder is None:
+		encoder = initialize_subsystem("encoder", create_encoder)
+	return encoder
+
+def select_option(menu: list[str]) -> int:
+	from encoder import selectOptionEncoder
+	return selectOptionEncoder(menu, get_display(), get_encoder())
+
+def report_startup() -> None:
+	subsystems = ", ".join(f"{name} {duration * 1000:.0f} ms" for name, duration in startup_times.items())
+	print(f"menu ready {perf_counter() - process_started:.2f} s after start ({subsystems or 'no subsystem loaded'})")
 
 def physical_board_in_desired_state(board: chess.Board):
+	from board_comparator import boardPiecePositionsIdentical
+	reader = get_reader()
 	reader.updateBoard()
 	return boardPiecePositionsIdentical(board, reader.getBoard())
 
 def put_physical_board_desired_state(board: chess.Board):
-	global reader
-	if reader is None:
+	if not UsePhysicalBoard:
 		return
 	while not physical_board_in_desired_state(board):
 		print("Please leave the board in the following state and press enter:")
 		print(board)
 		print("current detected board state is:")
-		print(reader.printBoard(reader.getBoard()))
+		print(get_reader().printBoard(get_reader().getBoard()))
 		input("waiting for player confirmation")
 
-def send_serial(board, move):
-	global ser
-	global reader
+def serial_message(board, move, real_pos):
 	msg = bytearray([int(board.piece_at(i) != None) for i in range(0, 64)])
 	msg.append(ord('|'))
 	#from square
@@ -59,7 +134,6 @@ def send_serial(board, move):
 	msg.append(y1)
 	msg.append(ord('|'))
 	#from square (mm)
-	real_pos = reader.getPieceRealPositionsMilimiters()
 	x_mm = real_pos[x1][y1][0]
 	y_mm = real_pos[x1][y1][1]
 	msg.append(x1)
@@ -71,51 +145,12 @@ def send_serial(board, move):
 	msg.append(ord('|'))
 	msg.append(int(move[3]) + 1)
 	msg.append(ord('|'))
-	print(msg)
-	ser.write(msg)
-
-def handle_lichess_gameState(state: states.GameState, event: dict[str, Any], board: chess.Board, color_id: int, game_id: str):
-	moves = event['moves'].split()
-
-	while len(moves) > len(board.move_stack):
-		move = moves[-(len(moves) - len(board.move_stack))]
-		board.push_uci(move)
-		print(move)
-		if UsePhysicalBoard:
-			send_serial(board, move)
-			put_physical_board_desired_state(board)
-		print(board)
-			
-	# Has draw offer to handle
-	if event.get("bdraw") and color_id == 0:
-		client.board.decline_draw(game_id)
-#		state = states.GameState.WHANDLING_DRAW
-#		if UseDisplay:
-#			display.setTopText("DRAW OFFER")
-	elif event.get("wdraw") and color_id == 1:
-		client.board.decline_draw(game_id)
-#		if UseDisplay:
- #                       display.setTopText("DRAW OFFER")
-#		state = states.GameState.BHANDLING_DRAW
-	# Has takeback offer to handle
-	elif event.get("btakeback") and color_id == 0:
-		client.board.decline_takeback(game_id)
-	elif event.get("wtakeback") and color_id == 1:
-		client.board.decline_takeback(game_id)
-			
-#	if len(event["moves"]) < len(board.move_stack):
-#		while len(event["moves"]) < len(board.move_stack): board.pop()
-#		return states.handle_transition(state, states.GameAction.ACCEPT)
+	return msg
 
-	# User's turn
-	if len(event["moves"].split()) % 2 == color_id:
-		state = handle_user_choice(state, board, game_id)
-	elif (state in [states.GameState.BHANDLING_DRAW, states.GameState.BHANDLING_TAKEBACK, states.GameState.WHANDLING_DRAW, states.GameState.WHANDLING_TAKEBACK]
-		and not any(x in event.keys() for x in ["bdraw", "wdraw", "btakeback", "wtakeback"])):
-		state = states.handle_transition(state, states.GameAction.DECLINE)
-	else:
-		state = states.handle_transition(state, states.GameAction.MOVE)
-	return state
+def send_serial(board, move):
+	msg = serial_message(board, move, get_reader().getPieceRealPositionsMillimeters())
+	print(msg)
+	get_serial().write(msg)
 
 def print_choices_menu(state: states.GameState) -> None:
 	print(state)
@@ -123,43 +158,15 @@ def print_choices_menu(state: states.GameState) -> None:
 	for i, action in enumerate(actions):
 		print(f"{i + 1} - {action.value}")
 
-def handle_user_choice(state: states.GameState, board: chess.Board, game_id) -> states.GameState:
-	global encoder
-	global display
+def ask_user_choice(state: states.GameState) -> int:
 	if UseDisplay:
 		menu = [opt.value for opt in states.TRANSITIONS[state].keys()]
-		opt = selectOptionEncoder(menu, display, encoder)
-	else:
+		return select_option(menu)
+	print_choices_menu(state)
+	while (opt := atoi(input("Choose your action: "))) not in range(1, len(states.TRANSITIONS[state].keys()) + 1):
+		print("Please, choose a valid action (only the action number)!")
 		print_choices_menu(state)
-		while (opt := atoi(input("Choose your action: "))) not in range(1, len(states.TRANSITIONS[state].keys()) + 1):
-			print("Please, choose a valid action (only the action number)!")
-			print_choices_menu(state)
-
-	action = list(states.TRANSITIONS[state].keys())[opt - 1]
-
-	if action == states.GameAction.MOVE:
-		handle_move(board, game_id)
-	elif action == states.GameAction.OFFER_DRAW:
-		client.board.offer_draw(game_id)
-	elif action == states.GameAction.OFFER_TAKEBACK:
-		client.board.offer_takeback(game_id)
-	elif action == states.GameAction.ACCEPT:
-		if state in [states.GameState.BHANDLING_DRAW, states.GameState.WHANDLING_DRAW]:
-			client.board.accept_draw(game_id)
-		else:
-			client.board.accept_takeback(game_id)
-			board.pop()
-			board.pop()
-			print(board)
-	elif action == states.GameAction.DECLINE:
-		if state in [states.GameState.BHANDLING_DRAW, states.GameState.WHANDLING_DRAW]:
-			client.board.decline_draw(game_id)
-		else:
-			client.board.decline_takeback(game_id)
-	elif action == states.GameAction.RESIGN:
-		client.board.resign_game(game_id)
-
-	return states.handle_transition(state, action)
+	return opt
 
 def is_legal_move(board: chess.Board, move: str):
 	try:
@@ -168,188 +175,58 @@ def is_legal_move(board: chess.Board, move: str):
 		print("Invalid UCI move string!")
 		return False
 
-def get_move(board):
-	if UsePhysicalBoard:
-		global reader
-		global display
-		global encoder
-		#input("make a move on the board and press enter")
-		attempts_before_request_try_again = 3
-		while True:
-			detectedMoves = reader.updateBoardGetMoves()
-			n_moves = len(detectedMoves)
-			if n_moves == 1:
-				return detectedMoves[0]
-			if n_moves == 0:
-				attempts_before_request_try_again -= 1
-				if attempts_before_request_try_again <= 0:
-					attempts_before_request_try_again = 3
-					display.setTopText("NO MOVE")
-					display.drawTitle()
-					sleep(2)
-					display.setTopText("TRY AGAIN")
-					selectOptionEncoder(["Move"], display, encoder)
-					#input("no moves detected on board! If you already did your move, please just press enter so it tries detecting it again")
-				continue
-
-			#input(f"too many moves detected!\n{detectedMoves}\nYou might have made an illegal move that was interpreted as two moves.\nplease return the board to its last legal state and try again")
-			display.setTopText("TO MANY MOVES")
-			selectOptionEncoder(["Return to original state"], display, encoder)
-			put_physical_board_desired_state(board)
-			display.clearDisplay()
-			selectOptionEncoder(["Move"], display, encoder)
-			#input("make a move on the board and press enter")
-	else:
-		return input("Make a legal uci move: ")
-
-def handle_move(board: chess.Board, game_id: str):
-	move = get_move(board)
-	while not is_legal_move(board, move):
-		move = get_move(board)
-	board.push_uci(move)
-	print(board)
-	client.board.make_move(game_id, move)
-
 def create_new_game_ai():
 	color = random.choice(["black", "white"])
 	if UseDisplay:
-		global display
-		global encoder
-		level = selectOptionEncoder(["AI Level: "+str(val) for val in range(1, 9)], display, encoder)
+		level = select_option(["AI Level: "+str(val) for val in range(1, 9)])
 	else:
 		while int(level := input("Select AI level [1-8]: ")) not in range(1, 9): pass
-	game = client.challenges.create_ai(level=level, color=color)
-	game_id = game["id"]
-	state = states.start_game()
-	print(f"https://lichess.org/{game_id}")
-	game_stream = client.board.stream_game_state(game_id)
-	full_game = next(game_stream)
-	print(full_game)
-	board = chess.Board(game["fen"])
-	print(board)
-	global UsePhysicalBoard
-	if UsePhysicalBoard:
-		print("checking if board in starting state...")
-		put_physical_board_desired_state(board)
-	color_id = 1 if color == "black" else 0
-	print("---------------------------")
-
-	try:
-		# In case of the first state already has a move
-		if len(full_game["state"]["moves"].split()) == 1: 
-			states.push_state(states.GameState.BLACKS_TURN)
-			state = states.GameState.BLACKS_TURN
-		
-		state = handle_lichess_gameState(state, full_game["state"], board, color_id, game_id)
-		states.push_state(state)
-
-		for event in game_stream:
-			if event["type"] == "gameState":
-				if event["status"] == "started":
-					state = handle_lichess_gameState(state, event, board, color_id, game_id)
-					states.push_state(state)
-		if UseDisplay:
-			display.setTopText(state.value)
-			display.drawTitle()
-			sleep(2)
-			display.setTopText(None)
-		else:
-			print(state.value)
-	except Exception as err:
-		client.board.resign_game(game_id)
-		print(f"Error occured: {err}")
-		print("Game aborted")
-		raise err
+	import asyncio
+	from lichess_game_runner import play_ai_game
+	asyncio.run(play_ai_game(level, color))
 
 def create_new_game_player():
 	color = random.choice(["black", "white"])
-	stream = client.board.stream_incoming_events()
-	client.board.seek(time=15, increment=60, color=color)
-	for e in stream:
-		if e["type"] == "gameStart" and e["game"]["source"] != "ai" and e["game"]["status"]["name"] == "started":
-			game = e["game"]
-			game_id = game["id"]
-			state = states.start_game()
-			print(f"https://lichess.org/{game_id}")
-			game_stream = client.board.stream_game_state(game_id)
-			full_game = next(game_stream) 
-			print(full_game)
-			board = chess.Board(game["fen"])
-			print(board)
-			global UsePhysicalBoard
-			if UsePhysicalBoard:
-				print("checking if board in starting state...")
-				put_physical_board_desired_state(board)
-
-			color_id = 1 if color == "black" else 0 
-			print("---------------------------")
-
-			try:
-				# In case of the first state already has a move
-				if len(full_game["state"]["moves"].split()) == 1: 
-					states.push_state(states.GameState.BLACKS_TURN)
-					state = states.GameState.BLACKS_TURN
-
-				state = handle_lichess_gameState(state, full_game["state"], board, color_id, game_id)
-				states.push_state(state)
-
-				for event in game_stream:
-					print(event)
-					if event["type"] == "gameState":
-						if event["status"] == "started":
-							state = handle_lichess_gameState(state, event, board, color_id, game_id)
-							states.push_state(state)
-				if UseDisplay:
-					display.setTopText(state.value)
-					display.drawTitle()
-					sleep(2)
-					display.setTopText(None)
-				else:
-					print(state.value)
-
-			except Exception as err:
-				client.board.resign_game(game_id)
-				print(f"Error occured: {err}")
-				print("Game aborted")
-				raise err
-		return
+	import asyncio
+	from lichess_game_runner import play_player_game
+	asyncio.run(play_player_game(color))
 
 def print_menu() -> str:
 	return input("1- New game against AI\n2- New game against player\n3- Quit\n")
 
 def print_interface_option():
 	if UseDisplay:
-		global display
-		global encoder
 		menu = ["Play on cmd", "Play on board"]
-		option = selectOptionEncoder(menu, display, encoder)
+		option = select_option(menu)
 	else:
 		option = input("1- play on command line\n2- Play using AutoMCS board\n")
 	if atoi(option) == 2:
 		global UsePhysicalBoard
 		UsePhysicalBoard = True
 
+def dump_timings(path: str = "timings") -> None:
+	timer.dumpJSON(f"{path}.json")
+	timer.dumpCSV(f"{path}.csv")
+
 def main() -> None:
 	if UseDisplay:
-		global display
-		global encoder
-		display = Display()
-		encoder = setupEncoder()
-		display.drawTitle()
+		get_display()
+		get_encoder()
+	report_startup()
 	print_interface_option()
 	if UsePhysicalBoard:
-		print("initializing autoMCS computer vision module, please wait...")
-		global reader
-		reader = BoardReader(resolution = (1920, 1296))
+		start_vision() # games only wait for it once they need the physical board
 	if UseDisplay:
 		menu = ["Play against AI", "Play against player", "Quit"]
-		while (opt := selectOptionEncoder(menu, display, encoder)) != 3:
+		while (opt := select_option(menu)) != 3:
 			if opt == 1: create_new_game_ai()
 			if opt == 2: create_new_game_player()
 	else:
 		while (opt := print_menu()) != "3":
 			if opt == "1": create_new_game_ai()
 			if opt == "2": create_new_game_player()
+	if MeasureTimes:
+		dump_timings()
 if __name__ == "__main__":
 	main()
 
@@ -0,0 +1,346 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import sleep
+from typing import Any, Callable
+
+import chess
+import states
+import lichess_api
+
+def timed(stage: str, function, *args, **kwargs):
+	with lichess_api.timer.measure(stage):
+		return function(*args, **kwargs)
+
+def show_top_text(text: str | None) -> None:
+	display = lichess_api.get_display()
+	display.setTopText(text)
+	display.drawTitle()
+
+def clear_display() -> None:
+	lichess_api.get_display().clearDisplay()
+
+def show_final_state(state: states.GameState) -> None:
+	show_top_text(state.value)
+	sleep(2)
+	lichess_api.get_display().setTopText(None)
+
+def write_serial(message: bytearray) -> None:
+	lichess_api.get_serial().write(message)
+
+class GameRunner:
+	'''plays one lichess board game on an asyncio event loop, with the game's event stream, the player (reading moves from the physical
+	board or the command line), the serial link to the physical board and the UI as independent tasks.
+	Everything that blocks runs on an executor with a single thread per subsystem, so calls to each device stay in order:
+	a slow make_move only holds back later lichess requests, and a board read only holds back the camera.
+	A menu still open when the game ends is left waiting for an answer, since a thread blocked on the encoder or on input() can't be interrupted'''
+
+	def __init__(self, client, game_id: str, board: chess.Board, color_id: int, move_source: Callable[[chess.Board], str | None] | None = None):
+		self.client = client
+		self.game_id = game_id
+		self.board = board
+		self.color_id = color_id
+		# asked for the player's moves instead of the physical board or the command line, e.g. to replay a game. Returning None resigns
+		self.move_source = move_source
+		self.use_physical_board = lichess_api.UsePhysicalBoard
+		self.use_display = lichess_api.UseDisplay
+
+		self.state = states.start_game()
+		self.executors = {name: ThreadPoolExecutor(max_workers = 1, thread_name_prefix = name) for name in ("stream", "lichess", "vision", "serial", "ui")}
+		self.lichess_requests = asyncio.Queue()
+		self.ui_requests = asyncio.Queue()
+		self.physical_moves = asyncio.Queue() # opponent moves the physical board still has to make
+		self.players_turn = asyncio.Event()
+		self.physical_board_ready = asyncio.Event()
+
+	async def run_blocking(self, executor: str, function, *args, **kwargs):
+		return await asyncio.get_running_loop().run_in_executor(self.executors[executor], partial(function, *args, **kwargs))
+
+	def send(self, requests: asyncio.Queue, function, *args) -> None:
+		'''queues a call without waiting for it. If it fails, the game is aborted'''
+		requests.put_nowait((function, args, None))
+
+	async def call(self, requests: asyncio.Queue, function, *args):
+		'''queues a call and waits for its result'''
+		future = asyncio.get_running_loop().create_future()
+		requests.put_nowait((function, args, future))
+		return await future
+
+	async def serve(self, requests: asyncio.Queue, executor: str) -> None:
+		'''the lichess request and UI tasks: makes the queued calls, in order, on the executor'''
+		while True:
+			function, args, future = await requests.get()
+			try:
+				result = await self.run_blocking(executor, function, *args)
+			except Exception as error:
+				if future is None:
+					raise
+				if not future.done():
+					future.set_exception(error)
+			else:
+				if future is not None and not future.done():
+					future.set_result(result)
+
+	def show(self, text: str | None) -> None:
+		if self.use_display:
+			self.send(self.ui_requests, show_top_text, text)
+		elif text is not None:
+			print(text)
+
+	def set_state(self, state: states.GameState) -> None:
+		if state != self.state:
+			self.state = state
+			states.push_state(state)
+			self.show(state.value)
+
+	def get_turn_state(self) -> states.GameState:
+		return states.GameState.WHITES_TURN if self.board.turn == chess.WHITE else states.GameState.BLACKS_TURN
+
+	def get_final_state(self, event: dict[str, Any]) -> states.GameState:
+		if event.get("winner") == "white":
+			return states.GameState.WHITE_WINS
+		if event.get("winner") == "black":
+			return states.GameState.BLACK_WINS
+		if event["status"] in ("draw", "stalemate"):
+			return states.GameState.DRAW
+		return self.state # aborted
+
+	def handle_game_state(self, event: dict[str, Any]) -> bool:
+		'''applies a game state sent by lichess to the board, returning False once the game is over'''
+		moves = event["moves"].split()
+		# the player's own moves were already pushed when they were made
+		while len(moves) > len(self.board.move_stack):
+			move = moves[len(self.board.move_stack)]
+			self.board.push_uci(move)
+			print(move)
+			print(self.board)
+			if self.use_physical_board:
+				self.physical_board_ready.clear()
+				self.physical_moves.put_nowait((self.board.copy(), move))
+
+		if event["status"] != "started":
+			self.set_state(self.get_final_state(event))
+			return False
+
+		# draw and takeback offers are declined
+		if (event.get("bdraw") and self.color_id == 0) or (event.get("wdraw") and self.color_id == 1):
+			self.send(self.lichess_requests, timed, "lichess_decline_draw", self.client.board.decline_draw, self.game_id)
+		elif (event.get("btakeback") and self.color_id == 0) or (event.get("wtakeback") and self.color_id == 1):
+			self.send(self.lichess_requests, timed, "lichess_decline_takeback", self.client.board.decline_takeback, self.game_id)
+
+		self.set_state(self.get_turn_state())
+		if len(moves) == len(self.board.move_stack) and len(moves) % 2 == self.color_id:
+			self.players_turn.set()
+		return True
+
+	async def follow_game(self) -> None:
+		'''the event stream task: applies every game state lichess sends to the board, until the game is over'''
+		stream = self.client.board.stream_game_state(self.game_id)
+		with lichess_api.timer.measure("lichess_open_game_stream"):
+			event = await self.run_blocking("stream", next, stream, None)
+		while event is not None:
+			if event["type"] == "gameFull":
+				print(event)
+				if not self.handle_game_state(event["state"]):
+					return
+			elif event["type"] == "gameState":
+				if not self.handle_game_state(event):
+					return
+			event = await self.run_blocking("stream", next, stream, None)
+
+	async def drive_physical_board(self) -> None:
+		'''the serial link task: sends the opponent's moves to the physical board and waits until they were made on it'''
+		while True:
+			board, move = await self.physical_moves.get()
+			reader = await self.run_blocking("vision", lichess_api.get_reader)
+			real_positions = await self.run_blocking("vision", reader.getPieceRealPositionsMillimeters)
+			message = lichess_api.serial_message(board, move, real_positions)
+			print(message)
+			await self.run_blocking("serial", write_serial, message)
+			await self.run_blocking("vision", lichess_api.put_physical_board_desired_state, board)
+			if self.physical_moves.empty():
+				self.physical_board_ready.set()
+
+	async def read_physical_move(self) -> str:
+		'''the vision loop: reads the board until exactly one move was made on it'''
+		reader = await self.run_blocking("vision", lichess_api.get_reader)
+		attempts_before_request_try_again = 3
+		while True:
+			detected_moves = await self.run_blocking("vision", reader.updateBoardGetMoves)
+			if reader.motion_gating and reader.getLastGateDecision() != "read":
+				# the board wasn't read: a hand is still over it, or nothing changed since the last read. Neither counts as an attempt
+				continue
+			if len(detected_moves) == 1:
+				return detected_moves[0]
+			if len(detected_moves) == 0:
+				attempts_before_request_try_again -= 1
+				if attempts_before_request_try_again <= 0:
+					attempts_before_request_try_again = 3
+					self.show("NO MOVE")
+					await asyncio.sleep(2)
+					self.show("TRY AGAIN")
+					await self.call(self.ui_requests, lichess_api.select_option, ["Move"])
+				continue
+
+			self.show("TO MANY MOVES")
+			await self.call(self.ui_requests, lichess_api.select_option, ["Return to original state"])
+			await self.run_blocking("vision", lichess_api.put_physical_board_desired_state, self.board.copy())
+			await self.call(self.ui_requests, clear_display)
+			await self.call(self.ui_requests, lichess_api.select_option, ["Move"])
+
+	async def get_move(self) -> str | None:
+		while True:
+			if self.move_source is not None:
+				move = await self.run_blocking("vision", self.move_source, self.board.copy())
+				if move is None:
+					return None
+			elif self.use_physical_board:
+				move = await self.read_physical_move()
+			else:
+				move = await self.call(self.ui_requests, input, "Make a legal uci move: ")
+			if lichess_api.is_legal_move(self.board, move):
+				return move
+
+	async def take_turn(self) -> None:
+		state = self.state
+		if self.move_source is not None:
+			action = states.GameAction.MOVE
+		else:
+			option = await self.call(self.ui_requests, lichess_api.ask_user_choice, state)
+			action = list(states.TRANSITIONS[state].keys())[option - 1]
+
+		if action == states.GameAction.MOVE:
+			move = await self.get_move()
+			if move is None:
+				action = states.GameAction.RESIGN
+			else:
+				self.board.push_uci(move)
+				print(self.board)
+				self.send(self.lichess_requests, timed, "lichess_make_move", self.client.board.make_move, self.game_id, move)
+
+		if action == states.GameAction.OFFER_DRAW:
+			self.send(self.lichess_requests, timed, "lichess_offer_draw", self.client.board.offer_draw, self.game_id)
+		elif action == states.GameAction.OFFER_TAKEBACK:
+			self.send(self.lichess_requests, timed, "lichess_offer_takeback", self.client.board.offer_takeback, self.game_id)
+		elif action == states.GameAction.ACCEPT:
+			if state in [states.GameState.BHANDLING_DRAW, states.GameState.WHANDLING_DRAW]:
+				self.send(self.lichess_requests, timed, "lichess_accept_draw", self.client.board.accept_draw, self.game_id)
+			else:
+				self.send(self.lichess_requests, timed, "lichess_accept_takeback", self.client.board.accept_takeback, self.game_id)
+				self.board.pop()
+				self.board.pop()
+				print(self.board)
+		elif action == states.GameAction.DECLINE:
+			if state in [states.GameState.BHANDLING_DRAW, states.GameState.WHANDLING_DRAW]:
+				self.send(self.lichess_requests, timed, "lichess_decline_draw", self.client.board.decline_draw, self.game_id)
+			else:
+				self.send(self.lichess_requests, timed, "lichess_decline_takeback", self.client.board.decline_takeback, self.game_id)
+		elif action == states.GameAction.RESIGN:
+			self.send(self.lichess_requests, timed, "lichess_resign", self.client.board.resign_game, self.game_id)
+
+		self.set_state(states.handle_transition(state, action))
+
+	async def play(self) -> None:
+		'''the player task: on the player's turn, asks what to do and gets the move'''
+		if self.use_physical_board:
+			print("checking if board in starting state...")
+			await self.run_blocking("vision", lichess_api.put_physical_board_desired_state, self.board.copy())
+		self.physical_board_ready.set()
+
+		while True:
+			await self.players_turn.wait()
+			self.players_turn.clear()
+			# the player only moves once the opponent's last move was made on the physical board
+			await self.physical_board_ready.wait()
+			await self.take_turn()
+
+	async def run_tasks(self) -> None:
+		coroutines = [self.follow_game(), self.play(), self.serve(self.lichess_requests, "lichess"), self.serve(self.ui_requests, "ui")]
+		if self.use_physical_board:
+			coroutines.append(self.drive_physical_board())
+		tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+		try:
+			# only following the game ends without an error, once lichess says the game is over
+			done, _ = await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
+			for task in done:
+				task.result()
+		finally:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions = True)
+
+	async def run(self) -> states.GameState:
+		'''plays the game until it is over and returns how it ended, resigning it if anything fails'''
+		try:
+			try:
+				await self.run_tasks()
+			except Exception as err:
+				await self.run_blocking("lichess", timed, "lichess_resign", self.client.board.resign_game, self.game_id)
+				print(f"Error occured: {err}")
+				print("Game aborted")
+				raise err
+			if self.use_display:
+				await self.run_blocking("ui", show_final_state, self.state)
+			return self.state
+		finally:
+			for executor in self.executors.values():
+				executor.shutdown(wait = False)
+
+async def play_ai_game(level: int, color: str, move_source = None) -> states.GameState:
+	'''challenges the lichess AI and plays the game, see GameRunner'''
+	loop = asyncio.get_running_loop()
+	client = await loop.run_in_executor(None, lichess_api.get_client)
+	with lichess_api.timer.measure("lichess_create_ai"):
+		game = await loop.run_in_executor(None, partial(client.challenges.create_ai, level = level, color = color))
+	print(f"https://lichess.org/{game['id']}")
+	board = chess.Board(game["fen"])
+	print(board)
+	print("---------------------------")
+	return await GameRunner(client, game["id"], board, 1 if color == "black" else 0, move_source).run()
+
+async def play_player_game(color: str, move_source = None) -> states.GameState | None:
+	'''seeks a game against another player and plays it, see GameRunner. Returns None if no game started'''
+	loop = asyncio.get_running_loop()
+	client = await loop.run_in_executor(None, lichess_api.get_client)
+	# the seek only returns once someone accepted it, and the event stream starts by listing the games being played
+	await loop.run_in_executor(None, partial(timed, "lichess_seek", client.board.seek, time = 15, increment = 60, color = color))
+	events = client.board.stream_incoming_events()
+	while (event := await loop.run_in_executor(None, timed, "lichess_incoming_event", next, events, None)) is not None:
+		if event["type"] == "gameStart" and event["game"]["source"] != "ai" and event["game"]["status"]["name"] == "started":
+			break
+	events.close()
+	if event is None:
+		return None
+
+	game = event["game"]
+	print(f"https://lichess.org/{game['id']}")
+	board = chess.Board(game["fen"])
+	print(board)
+	print("---------------------------")
+	return await GameRunner(client, game["id"], board, 1 if color == "black" else 0, move_source).run()
+
+if __name__ == "__main__":
+	# plays one game on the command line, e.g. against the stand-in server:
+	# python lichess_stand_in.py & python lichess_game_runner.py --url http://localhost:8080 --token stand-in --moves e2e4 g1f3 f1c4
+	from argparse import ArgumentParser
+
+	parser = ArgumentParser(description = "plays one lichess board game on the command line")
+	parser.add_argument("--url", help = "lichess server to play on, e.g. the one started by lichess_stand_in.py")
+	parser.add_argument("--token", help = "lichess API token, read from .lichess.token by default")
+	parser.add_argument("--seek", action = "store_true", help = "seeks a game against another player instead of challenging the AI")
+	parser.add_argument("--level", type = int, default = 1, help = "AI level")
+	parser.add_argument("--color", choices = ["white", "black"], default = "white")
+	parser.add_argument("--moves", nargs = "+", help = "plays these moves, skipping illegal ones, and resigns once they run out, instead of asking for them")
+	arguments = parser.parse_args()
+
+	lichess_api.UseDisplay = False
+	lichess_api.client = lichess_api.create_client(arguments.url, arguments.token)
+	move_source = None
+	if arguments.moves:
+		moves = iter(arguments.moves)
+		move_source = lambda board: next(moves, None)
+	if arguments.seek:
+		asyncio.run(play_player_game(arguments.color, move_source))
+	else:
+		asyncio.run(play_ai_game(arguments.level, arguments.color, move_source))
@@ -0,0 +1,309 @@
+# a stand-in for the parts of the lichess board API autoMCS uses, to play games without a lichess account or network, e.g.
+# python lichess_stand_in.py & python lichess_game_runner.py --url http://localhost:8080 --token stand-in --moves e2e4 g1f3 f1c4
+# Any token is accepted. The opponent (the "AI" or whoever accepts a seek) plays random legal moves and declines every offer
+from __future__ import annotations
+import chess
+import random
+import re
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from json import dumps, loads
+from threading import Condition, Timer
+from time import time
+from urllib.parse import parse_qs
+
+class StandInGame:
+	def __init__(self, game_id: str, color: str, source: str):
+		self.id = game_id
+		self.color = color # the player's color, the stand-in plays the other one
+		self.source = source
+		self.board = chess.Board()
+		self.status = "started"
+		self.winner = None
+		self.created_at = int(time() * 1000)
+		self.version = 0 # incremented on every change, so streams know when to send a new state
+
+	def is_players_turn(self) -> bool:
+		return self.status == "started" and self.board.turn == (self.color == "white")
+
+	def push(self, move: chess.Move) -> None:
+		self.board.push(move)
+		outcome = self.board.outcome()
+		if outcome is not None:
+			self.status = "mate" if outcome.termination == chess.Termination.CHECKMATE else "draw"
+			self.winner = None if outcome.winner is None else ("white" if outcome.winner else "black")
+		self.version += 1
+
+	def resign(self) -> None:
+		self.status = "resign"
+		self.winner = "black" if self.color == "white" else "white"
+		self.version += 1
+
+	def get_state(self) -> dict:
+		state = {
+			"type": "gameState",
+			"moves": " ".join(move.uci() for move in self.board.move_stack),
+			"wtime": 900000,
+			"btime": 900000,
+			"winc": 60000,
+			"binc": 60000,
+			"status": self.status,
+		}
+		if self.winner is not None:
+			state["winner"] = self.winner
+		return state
+
+	def get_full(self) -> dict:
+		players = {"player": {"id": "player", "name": "player"}, "stand-in": {"id": "stand-in", "name": "stand-in"}}
+		return {
+			"type": "gameFull",
+			"id": self.id,
+			"variant": {"key": "standard", "name": "Standard", "short": "Std"},
+			"speed": "classical",
+			"rated": False,
+			"createdAt": self.created_at,
+			"white": players["player" if self.color == "white" else "stand-in"],
+			"black": players["player" if self.color == "black" else "stand-in"],
+			"initialFen": "startpos",
+			"state": self.get_state(),
+		}
+
+	def get_summary(self) -> dict:
+		'''the game as described by create_ai and the gameStart events'''
+		return {
+			"id": self.id,
+			"gameId": self.id,
+			"fullId": self.id,
+			"color": self.color,
+			"fen": self.board.fen(),
+			"source": self.source,
+			"status": {"id": 20, "name": "started"} if self.status == "started" else {"id": 30, "name": self.status},
+			"variant": {"key": "standard", "name": "Standard"},
+			"speed": "classical",
+			"rated": False,
+			"isMyTurn": self.is_players_turn(),
+			"opponent": {"id": "stand-in", "username": "stand-in", "rating": 1500},
+		}
+
+class LichessStandIn(ThreadingHTTPServer):
+	'''serves the lichess board API on address. The opponent answers every move after reply_delay seconds, and streams send an empty
+	keep alive line every keep_alive seconds like lichess does'''
+
+	daemon_threads = True
+
+	def __init__(self, address = ("localhost", 8080), reply_delay = 0.5, keep_alive = 6, seed = None):
+		super().__init__(address, StandInRequestHandler)
+		self.reply_delay = reply_delay
+		self.keep_alive = keep_alive
+		self.random = random.Random(seed)
+		self.games = {}
+		self.condition = Condition() # guards the games, and is notified whenever one changes
+
+	def create_game(self, color: str, source: str) -> StandInGame:
+		with self.condition:
+			if color not in ("white", "black"):
+				color = self.random.choice(["white", "black"])
+			game = StandInGame(f"{len(self.games) + 1:08d}", color, source)
+			self.games[game.id] = game
+			self.condition.notify_all()
+		if not game.is_players_turn():
+			self.reply_later(game)
+		return game
+
+	def reply_later(self, game: StandInGame) -> None:
+		timer = Timer(self.reply_delay, self.reply, (game,))
+		timer.daemon = True
+		timer.start()
+
+	def reply(self, game: StandInGame) -> None:
+		with self.condition:
+			if game.status != "started" or game.is_players_turn():
+				return
+			game.push(self.random.choice(list(game.board.legal_moves)))
+			self.condition.notify_all()
+
+	def play(self, game: StandInGame, uci: str) -> bool:
+		'''makes the player's move, returning False if it isn't legal or not the player's turn'''
+		with self.condition:
+			try:
+				move = chess.Move.from_uci(uci)
+			except chess.InvalidMoveError:
+				return False
+			if not game.is_players_turn() or not game.board.is_legal(move):
+				return False
+			game.push(move)
+			self.condition.notify_all()
+		self.reply_later(game)
+		return True
+
+	def resign(self, game: StandInGame) -> bool:
+		with self.condition:
+			if game.status != "started":
+				return False
+			game.resign()
+			self.condition.notify_all()
+		return True
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1" # streams are sent in chunks, one line per event, like lichess does
+
+	get_routes = [
+		(re.compile(r"/api/board/game/stream/(\w+)"), "stream_game"),
+		(re.compile(r"/api/stream/event"), "stream_events"),
+	]
+	post_routes = [
+		(re.compile(r"/api/challenge/ai"), "create_ai"),
+		(re.compile(r"/api/board/seek"), "seek"),
+		(re.compile(r"/api/board/game/(\w+)/move/(\w+)"), "make_move"),
+		(re.compile(r"/api/board/game/(\w+)/resign"), "resign_game"),
+		(re.compile(r"/api/board/game/(\w+)/(?:draw|takeback)/(?:yes|no)"), "answer_offer"),
+	]
+
+	def log_message(self, format, *args):
+		pass
+
+	def route(self, routes):
+		path = self.path.split("?")[0]
+		for pattern, name in routes:
+			match = pattern.fullmatch(path)
+			if match is not None:
+				return getattr(self, name)(*match.groups())
+		self.send_json({"error": "Not found"}, 404)
+
+	def do_GET(self):
+		self.route(self.get_routes)
+
+	def do_POST(self):
+		length = int(self.headers.get("Content-Length", 0))
+		self.body = self.rfile.read(length).decode() if length > 0 else ""
+		self.route(self.post_routes)
+
+	def get_parameters(self) -> dict:
+		'''returns the parameters of the request body, sent as JSON or as a form'''
+		if self.headers.get("Content-Type", "").startswith("application/json"):
+			return loads(self.body or "{}")
+		return {key: values[0] for key, values in parse_qs(self.body).items()}
+
+	def get_game(self, game_id: str) -> StandInGame | None:
+		game = self.server.games.get(game_id)
+		if game is None:
+			self.send_json({"error": "Not found"}, 404)
+		return game
+
+	def send_json(self, data: dict, status = 200):
+		body = dumps(data).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def send_ok(self):
+		self.send_json({"ok": True})
+
+	def start_stream(self):
+		self.send_response(200)
+		self.send_header("Content-Type", "application/x-ndjson")
+		self.send_header("Transfer-Encoding", "chunked")
+		self.end_headers()
+		self.close_connection = True
+
+	def send_line(self, data: dict | None):
+		'''sends one event of a stream, or a keep alive empty line'''
+		line = ("" if data is None else dumps(data)).encode() + b"\n"
+		self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+		self.wfile.flush()
+
+	def end_stream(self):
+		self.wfile.write(b"0\r\n\r\n")
+
+	def create_ai(self):
+		parameters = self.get_parameters()
+		game = self.server.create_game(parameters.get("color") or "random", "ai")
+		self.send_json(game.get_summary(), 201)
+
+	def seek(self):
+		# lichess keeps the seek open until someone accepts it, here someone always does right away
+		self.server.create_game(self.get_parameters().get("color", "random"), "lobby")
+		self.start_stream()
+		self.end_stream()
+
+	def make_move(self, game_id, move):
+		game = self.get_game(game_id)
+		if game is None:
+			return
+		if not self.server.play(game, move):
+			self.send_json({"error": "Not your turn, or game already over"}, 400)
+			return
+		self.send_ok()
+
+	def resign_game(self, game_id):
+		game = self.get_game(game_id)
+		if game is None:
+			return
+		if not self.server.resign(game):
+			self.send_json({"error": "Game already over"}, 400)
+			return
+		self.send_ok()
+
+	def answer_offer(self, game_id):
+		# offers are never made by the stand-in and always declined by it
+		if self.get_game(game_id) is not None:
+			self.send_ok()
+
+	def stream_game(self, game_id):
+		game = self.get_game(game_id)
+		if game is None:
+			return
+		condition = self.server.condition
+		try:
+			self.start_stream()
+			with condition:
+				version = game.version
+				event = game.get_full()
+			self.send_line(event)
+			# lichess ends the stream once the state of the finished game was sent
+			while True:
+				with condition:
+					if game.status != "started":
+						break
+					changed = condition.wait_for(lambda: game.version != version, self.server.keep_alive)
+					version = game.version
+					event = game.get_state() if changed else None
+				self.send_line(event)
+			self.end_stream()
+		except (BrokenPipeError, ConnectionResetError):
+			pass # the client stopped following the game
+
+	def stream_events(self):
+		condition = self.server.condition
+		try:
+			self.start_stream()
+			# like lichess, the stream starts with the games being played
+			sent = set()
+			while True:
+				with condition:
+					games = [game for game in self.server.games.values() if game.status == "started" and game.id not in sent]
+					if len(games) == 0:
+						condition.wait(self.server.keep_alive)
+						games = [game for game in self.server.games.values() if game.status == "started" and game.id not in sent]
+					events = [{"type": "gameStart", "game": game.get_summary()} for game in games]
+				sent.update(game.id for game in games)
+				for event in events:
+					self.send_line(event)
+				if len(events) == 0:
+					self.send_line(None)
+		except (BrokenPipeError, ConnectionResetError):
+			pass # the client stopped following its events
+
+if __name__ == "__main__":
+	from argparse import ArgumentParser
+
+	parser = ArgumentParser(description = "serves a stand-in for the lichess board API")
+	parser.add_argument("--port", type = int, default = 8080)
+	parser.add_argument("--reply-delay", type = float, default = 0.5, help = "seconds the opponent takes to answer a move")
+	parser.add_argument("--seed", type = int, help = "seed of the opponent's random moves")
+	arguments = parser.parse_args()
+
+	server = LichessStandIn(("localhost", arguments.port), reply_delay = arguments.reply_delay, seed = arguments.seed)
+	print(f"lichess stand-in serving on http://localhost:{arguments.port}")
+	server.serve_forever()
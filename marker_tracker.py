@@ -0,0 +1,62 @@
+from cv2 import calcOpticalFlowPyrLK, TERM_CRITERIA_COUNT, TERM_CRITERIA_EPS
+from numpy import float32, abs as absolute
+
+class MarkerTracker:
+	'''follows the corners of the arucos found by a full detection from frame to frame with pyramidal Lucas-Kanade optical flow,
+	so most frames don't need the arucos decoded again. Tracking gives up, asking for a full detection, when any aruco corner is lost:
+	the flow didn't converge, tracking it back to the previous frame lands more than max_backtrack_error pixels away from where it started,
+	or the image around it changed by more than max_patch_error luminance levels on average (a piece was lifted or a hand covers it).
+	It also gives up every verify_every frames, so arucos that appeared since the last detection are found'''
+
+	def __init__(self, verify_every = 10, window_size = (21, 21), max_level = 3, max_backtrack_error = 0.5, max_patch_error = 20):
+		self.verify_every = verify_every
+		self.window_size = window_size
+		self.max_level = max_level
+		self.criteria = (TERM_CRITERIA_COUNT | TERM_CRITERIA_EPS, 30, 0.01)
+		self.max_backtrack_error = max_backtrack_error
+		self.max_patch_error = max_patch_error
+		self.stop()
+
+	def start(self, gray, corners, ids):
+		'''starts tracking the arucos detected in a frame, with corners and ids as returned by the aruco detector'''
+		if ids is None or len(ids) == 0:
+			self.stop()
+			return
+		# cameras reuse their frame buffers, so the frame is copied to still be there when the next one is tracked
+		self.previous_frame = gray.copy()
+		self.points = float32(corners).reshape((-1, 1, 2))
+		self.ids = ids
+		self.tracked_frames = 0
+
+	def stop(self):
+		self.previous_frame = None
+		self.points = None
+		self.ids = None
+		self.tracked_frames = 0
+
+	def _flow(self, first, second, points):
+		return calcOpticalFlowPyrLK(first, second, points, None, winSize = self.window_size, maxLevel = self.max_level, criteria = self.criteria)
+
+	def track(self, gray):
+		'''returns the corners and ids of the arucos tracked into this frame, in the same format as the aruco detector,
+		or None if a full detection is needed. Tracking stops once it returned None, until start is called again'''
+		if self.previous_frame is None or self.tracked_frames >= self.verify_every or gray.shape != self.previous_frame.shape:
+			self.stop()
+			return None
+
+		points, status, patch_error = self._flow(self.previous_frame, gray, self.points)
+		back_points, back_status, _ = self._flow(gray, self.previous_frame, points)
+		backtrack_error = absolute(back_points - self.points).max(axis = 2)
+		tracked = (status == 1) & (back_status == 1) & (backtrack_error <= self.max_backtrack_error) & (patch_error <= self.max_patch_error)
+		if not tracked.all():
+			self.stop()
+			return None
+
+		self.previous_frame = gray.copy()
+		self.points = points
+		self.tracked_frames += 1
+		return tuple(points.reshape((-1, 1, 4, 2))), self.ids
+
+	def getTrackedFrames(self) -> int:
+		'''returns how many frames were tracked since the last full detection'''
+		return self.tracked_frames
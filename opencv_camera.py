@@ -1,45 +1,181 @@
-from cv2 import VideoCapture, CAP_PROP_FRAME_WIDTH, CAP_PROP_FRAME_HEIGHT, CAP_PROP_BUFFERSIZE, CAP_PROP_FPS
+from cv2 import VideoCapture, CAP_PROP_FRAME_WIDTH, CAP_PROP_FRAME_HEIGHT, CAP_PROP_BUFFERSIZE, CAP_PROP_FPS, CAP_PROP_CONVERT_RGB, CAP_PROP_FOURCC
+from cv2 import cvtColor, COLOR_BGR2GRAY
 from numpy import int32
+from threading import Condition, Thread, current_thread
+from time import monotonic, sleep
+from weakref import WeakSet
+from atexit import register
+from camera_error import CameraError
+
+# cameras still grabbing when the interpreter exits are closed first, since killing a thread inside OpenCV aborts the process
+_open_cameras = WeakSet()
+
+@register
+def _closeOpenCameras():
+	for camera in list(_open_cameras):
+		camera.close()
 
 class Camera:
-	def __init__(self, resolution):
+	def __init__(self, resolution, grayscale = False, max_frame_age = None, capture_timeout = 5, reconnect_attempts = 3, device = 0, recorder = None, framerate = 30):
 		self.resolution = int32(resolution)
-		self.cap = VideoCapture(0)
+		self.grayscale = grayscale
+		self.max_frame_age = max_frame_age
+		self.capture_timeout = capture_timeout
+		self.reconnect_attempts = reconnect_attempts
+		self.device = device
+		self.framerate = framerate
+		self.recorder = recorder # a FrameRecorder every frame is copied into, if the session is being recorded
+		self.raw_frames = grayscale # whether the driver is asked for raw YUYV frames instead of BGR ones
+		self.cap = self._open()
+
+		# a background thread keeps reading frames so capture() gets the latest one instead of waiting for the next read
+		self.current_frame = None
+		self.timestamp = None
+		self.sequence = 0 # sequence number of the latest frame, 0 before the first one
+		self.returned_sequence = 0
+		self.returned_timestamp = None
+		self.error = None
+		self.running = True
+		self.condition = Condition()
+		self.thread = Thread(target=self.__grab)
+		self.thread.daemon = True
+		self.thread.start()
+		_open_cameras.add(self)
+
+	def _open(self):
+		cap = VideoCapture(self.device)
 
-		ret = self.cap.set(CAP_PROP_FRAME_WIDTH, resolution[0])
+		if not cap.isOpened():
+			raise CameraError(f"failed to open camera {self.device}")
+
+		ret = cap.set(CAP_PROP_FRAME_WIDTH, self.resolution[0])
 
 		if (ret != True):
-			print("failed to set frame width")
-			exit(-1)
+			raise CameraError("failed to set frame width")
 
-		ret = self.cap.set(CAP_PROP_FRAME_HEIGHT,resolution[1])
+		ret = cap.set(CAP_PROP_FRAME_HEIGHT, self.resolution[1])
 
 		if (ret != True):
-			print("failed to set frame height")
-			exit(-1)
+			raise CameraError("failed to set frame height")
 
 		# default buffer size is 10, meaning we get "very old" images instead of the latest
-		ret = self.cap.set(CAP_PROP_BUFFERSIZE, 1)
+		ret = cap.set(CAP_PROP_BUFFERSIZE, 1)
 
 		if (ret != True):
-			print("failed to set buffer size")
-			exit(-1)
+			raise CameraError("failed to set buffer size")
 
-		ret = self.cap.set(CAP_PROP_FPS, 1)
+		# the grabber thread reads every frame, so the frame rate bounds how old the latest one can be
+		ret = cap.set(CAP_PROP_FPS, self.framerate)
 
 		if (ret != True):
-			print("failed to set FPS")
-			exit(-1)
+			raise CameraError("failed to set FPS")
+
+		# in grayscale mode, ask the driver for the raw YUYV frames so the luminance can be used as is, without a conversion to BGR.
+		# Not every backend supports it, in which case capture() converts the BGR frames instead
+		if self.raw_frames and self._getFourCC(cap) not in ("YUYV", "YUY2"):
+			self.raw_frames = False
+		if self.raw_frames and not cap.set(CAP_PROP_CONVERT_RGB, 0):
+			self.raw_frames = False
+
+		return cap
+
+	def _getFourCC(self, cap):
+		return int(cap.get(CAP_PROP_FOURCC)).to_bytes(4, "little").decode("ascii", "replace")
 
 	def __del__(self):
-		# releases camera resource
+		self.close()
+
+	def close(self):
+		'''stops the grabber thread and releases the camera. The grabber thread keeps the camera alive, so __del__ only runs after this'''
+		with self.condition:
+			if not self.running:
+				return
+			self.running = False
+		if self.thread is not current_thread():
+			self.thread.join()
 		self.cap.release()
+		_open_cameras.discard(self)
+
+	def _isFresh(self):
+		return self.max_frame_age is None or monotonic() - self.timestamp <= self.max_frame_age
+
+	def capture(self, min_seq = None):
+		'''blocks until a frame with sequence number min_seq or later, and no older than max_frame_age seconds, is available and returns it.
+		By default waits for a frame newer than the one returned by the last call.
+		Raises CameraError if the camera stopped working or no such frame arrives within capture_timeout seconds'''
+		deadline = monotonic() + self.capture_timeout
+		with self.condition:
+			if min_seq is None:
+				min_seq = self.returned_sequence + 1
+			while self.error is None and not (self.sequence >= min_seq and self._isFresh()):
+				remaining = deadline - monotonic()
+				if remaining <= 0:
+					raise CameraError(f"no frame arrived in {self.capture_timeout} seconds")
+				self.condition.wait(remaining)
+			if self.error is not None:
+				raise CameraError("camera stopped working") from self.error
+			self.returned_sequence = self.sequence
+			self.returned_timestamp = self.timestamp
+			return self.current_frame
+
+	def getSequence(self):
+		'''returns the sequence number of the frame returned by the last call to capture'''
+		return self.returned_sequence
+
+	def getTimestamp(self):
+		'''returns when (in time.monotonic() seconds) the frame returned by the last call to capture was read'''
+		return self.returned_timestamp
+
+	def _reconnect(self):
+		last_error = None
+		for attempt in range(self.reconnect_attempts):
+			print(f"failed to read image! reconnecting to camera (attempt {attempt + 1} of {self.reconnect_attempts})")
+			self.cap.release()
+			sleep(1)
+			try:
+				self.cap = self._open()
+				return
+			except CameraError as error:
+				last_error = error
+		raise CameraError(f"could not reconnect to camera after {self.reconnect_attempts} attempts") from last_error
+
+	def __grab(self):
+		try:
+			while self.running:
+				ret, img = self.cap.read()
+				if ret != True:
+					self._reconnect()
+					continue
+				timestamp = monotonic()
+				if self.grayscale:
+					img = self._toGrayscale(img)
+					if img is None:
+						print("camera frames aren't raw YUYV, converting them to BGR instead")
+						self.raw_frames = False
+						self.cap.set(CAP_PROP_CONVERT_RGB, 1)
+						continue
+				if self.recorder is not None:
+					self.recorder.record(img, timestamp)
+				with self.condition:
+					self.current_frame = img
+					self.timestamp = timestamp
+					self.sequence += 1
+					self.condition.notify_all()
+		except Exception as error:
+			with self.condition:
+				self.error = error
+				self.condition.notify_all()
 
-	def capture(self):
-		ret, img = self.cap.read()
-		if ret != True:
-			print("failed to read image!")
-			exit(-1)
+	def _toGrayscale(self, img):
+		'''returns the luminance of a frame, or None if it is a raw frame that can't be read as YUYV at the camera resolution'''
+		width, height = self.resolution
+		if self.raw_frames:
+			# V4L2 hands raw frames over as a single row of bytes
+			if img.size != width * height * 2:
+				return None
+			return img.reshape((height, width, 2))[:, :, 0] # YUYV: the first byte of every pixel is its luminance
+		if img.ndim == 3:
+			return cvtColor(img, COLOR_BGR2GRAY)
 		return img
 
 	def getRealResolution(self):
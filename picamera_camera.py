@@ -1,37 +1,156 @@
 from picamera import PiCamera
 from numpy import uint8, int32, empty
-from threading import Lock, Thread
-from time import sleep
+from threading import Condition, Thread, current_thread
+from time import monotonic, sleep
+from camera_error import CameraError
 class Camera:
-	def __init__(self, resolution):
-		self.camera = PiCamera(resolution = resolution, framerate = 1)
+	def __init__(self, resolution, buffer_slots = 3, grayscale = False, max_frame_age = None, capture_timeout = 5, streaming = False, framerate = 1, lock_exposure = True, recorder = None):
+		self.camera = PiCamera(resolution = resolution, framerate = framerate)
 		self.resolution = int32(self.camera.resolution)
-		self.frame_size = self.resolution[0]*self.resolution[1]*3
+		self.streaming = streaming
+		if self.streaming and lock_exposure:
+			self.__lockExposureAndWhiteBalance()
 
-		self.current_frame = None
-		self.lock = Lock()
+		# frames are written into a fixed ring of buffers instead of a new array per capture. A slot is never overwritten while it holds
+		# the latest frame or the frame last returned by capture(), which is why at least 3 slots are needed
+		if buffer_slots < 3:
+			raise ValueError(f"the frame ring buffer needs at least 3 slots, got {buffer_slots}")
+		self.grayscale = grayscale
+		if self.grayscale:
+			self.buffers = [empty((self.__getYUVFrameSize(),), dtype=uint8) for _ in range(buffer_slots)]
+			self.frames = [self.__getYPlane(buffer) for buffer in self.buffers]
+		else:
+			self.buffers = [empty((self.resolution[1], self.resolution[0], 3), dtype=uint8) for _ in range(buffer_slots)]
+			self.frames = self.buffers
+		self.max_frame_age = max_frame_age
+		self.capture_timeout = capture_timeout
+		self.recorder = recorder # a FrameRecorder every frame is copied into, if the session is being recorded
+		self.sequence = 0 # sequence number of the latest complete frame, 0 before the first one
+		self.timestamp = None
+		self.latest_slot = None
+		self.held_slot = None
+		self.returned_sequence = 0
+		self.returned_timestamp = None
+		self.error = None
+		self.running = True
+		self.condition = Condition()
 		self.thread = Thread(target=self.__capture)
 		self.thread.daemon = True
 		self.thread.start()
 	def __del__(self):
-		# releases camera resource
+		self.close()
+
+	def close(self):
+		'''stops capturing and releases the camera. The capture thread keeps the camera alive, so __del__ only runs after this'''
+		with self.condition:
+			if not self.running:
+				return
+			self.running = False
+		# the capture thread stops after the frame being captured
+		if self.thread is not current_thread():
+			self.thread.join(self.capture_timeout)
 		self.camera.close()
 
-	def capture(self):
-		while self.current_frame is None:
-			pass
-		with self.lock:
-			ret_frame = self.current_frame
-		return ret_frame
+	def _isFresh(self):
+		return self.max_frame_age is None or monotonic() - self.timestamp <= self.max_frame_age
 
+	def capture(self, min_seq = None):
+		'''blocks until a frame with sequence number min_seq or later, and no older than max_frame_age seconds, is available and returns it.
+		By default waits for a frame newer than the one returned by the last call.
+		Raises CameraError if the camera stopped working or no such frame arrives within capture_timeout seconds'''
+		deadline = monotonic() + self.capture_timeout
+		with self.condition:
+			if min_seq is None:
+				min_seq = self.returned_sequence + 1
+			while self.error is None and not (self.sequence >= min_seq and self._isFresh()):
+				remaining = deadline - monotonic()
+				if remaining <= 0:
+					raise CameraError(f"no frame arrived in {self.capture_timeout} seconds")
+				self.condition.wait(remaining)
+			if self.error is not None:
+				raise CameraError("camera stopped working") from self.error
+			self.held_slot = self.latest_slot
+			self.returned_sequence = self.sequence
+			self.returned_timestamp = self.timestamp
+			return self.frames[self.held_slot]
 
-	def __capture(self):
+	def getSequence(self):
+		'''returns the sequence number of the frame returned by the last call to capture'''
+		return self.returned_sequence
+
+	def getTimestamp(self):
+		'''returns when (in time.monotonic() seconds) the frame returned by the last call to capture finished being read'''
+		return self.returned_timestamp
+
+	# YUV420 captures are padded to a width multiple of 32 and a height multiple of 16, and start with the full Y (luminance) plane
+	def __getPaddedResolution(self):
+		return (self.resolution + (31, 15)) // (32, 16) * (32, 16)
+
+	def __getYUVFrameSize(self):
+		padded_width, padded_height = self.__getPaddedResolution()
+		return padded_width * padded_height * 3 // 2
+
+	def __getYPlane(self, buffer):
+		padded_width, padded_height = self.__getPaddedResolution()
+		y_plane = buffer[:padded_width * padded_height].reshape((padded_height, padded_width))
+		return y_plane[:self.resolution[1], :self.resolution[0]]
+
+	def __getFreeSlot(self):
+		slot = 0 if self.latest_slot is None else self.latest_slot
 		while True:
-			img = empty((self.frame_size,), dtype=uint8)
-			self.camera.capture(img, 'bgr')
-			with self.lock:
-				self.current_frame = img.reshape((self.resolution[1], self.resolution[0], 3))
-			sleep(0.2)
+			slot = (slot + 1) % len(self.buffers)
+			if slot != self.latest_slot and slot != self.held_slot:
+				return slot
+
+	def __lockExposureAndWhiteBalance(self):
+		# lets the automatic gain and white balance settle, then fixes them so the brightness of consecutive video frames doesn't drift
+		sleep(2)
+		self.camera.shutter_speed = self.camera.exposure_speed
+		self.camera.exposure_mode = 'off'
+		gains = self.camera.awb_gains
+		self.camera.awb_mode = 'off'
+		self.camera.awb_gains = gains
+
+	def __getFormat(self):
+		return 'yuv' if self.grayscale else 'bgr'
+
+	def __publish(self, slot):
+		timestamp = monotonic()
+		if self.recorder is not None:
+			self.recorder.record(self.frames[slot], timestamp)
+		with self.condition:
+			self.latest_slot = slot
+			self.timestamp = timestamp
+			self.sequence += 1
+			self.condition.notify_all()
+
+	def __streamOutputs(self):
+		'''yields a free ring buffer slot for every video frame. capture_sequence only asks for the next output after the last one was
+		written, so the previous slot can be published at that point'''
+		slot = None
+		while self.running:
+			if slot is not None:
+				self.__publish(slot)
+			with self.condition:
+				slot = self.__getFreeSlot()
+			yield self.buffers[slot]
+
+	def __capture(self):
+		try:
+			if self.streaming:
+				# the video port delivers frames continuously at the configured framerate, without the mode switch of every still capture
+				self.camera.capture_sequence(self.__streamOutputs(), self.__getFormat(), use_video_port = True)
+			else:
+				while self.running:
+					with self.condition:
+						slot = self.__getFreeSlot()
+					self.camera.capture(self.buffers[slot], self.__getFormat())
+					self.__publish(slot)
+					sleep(0.2)
+		except Exception as error:
+			with self.condition:
+				self.error = error
+				self.condition.notify_all()
 
 
 	def getRealResolution(self):
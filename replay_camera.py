@@ -0,0 +1,239 @@
+from cv2 import VideoCapture, CAP_PROP_FPS, CAP_PROP_POS_MSEC, imread, IMREAD_GRAYSCALE, cvtColor, COLOR_BGR2GRAY, resize, INTER_AREA, INTER_LINEAR
+from numpy import int32
+from os import listdir
+from os.path import isdir, isfile, join, basename, splitext
+from queue import Queue, Empty, Full
+from threading import Condition, Thread, current_thread
+from time import monotonic
+from weakref import WeakSet
+from atexit import register
+from camera_error import CameraError, ReplayFinished
+from frame_recording import FrameRecording
+
+image_extensions = (".png", ".jpg", ".jpeg", ".bmp")
+
+# replays still decoding when the interpreter exits are stopped first, since killing a thread inside OpenCV aborts the process
+_open_replays = WeakSet()
+
+@register
+def _closeOpenReplays():
+	for replay in list(_open_replays):
+		replay.close()
+
+class Camera:
+	'''replays recorded frames through the same interface as the live cameras, so BoardReader runs its production code path without a camera.
+	The source is an image, a directory of images (replayed in name order), a list of image paths, a video file or a FrameRecorder
+	recording (.npy), whose frames are handed over without being copied when no conversion or scaling is needed.
+	Frames are decoded and scaled to the resolution on a background thread, up to decode_ahead frames before they are needed.
+	By default every frame is delivered, as fast as capture() asks for them; with realtime, frames are published at the framerate
+	(or the video's own) like a live camera, and frames nobody captured in time are skipped.
+	Once every frame was delivered, capture() raises ReplayFinished, unless loop is set'''
+
+	def __init__(self, resolution, source, grayscale = False, max_frame_age = None, capture_timeout = 5, realtime = False, framerate = None, loop = False, decode_ahead = 4):
+		self.resolution = int32(resolution)
+		self.source = source
+		self.grayscale = grayscale
+		self.max_frame_age = max_frame_age
+		self.capture_timeout = capture_timeout
+		self.realtime = realtime
+		self.framerate = framerate
+		self.loop = loop
+		self.images = self.__listImages(source)
+		if self.images is not None and len(self.images) == 0:
+			raise CameraError(f"no images to replay in {source}")
+		if self.images is None and not isfile(source):
+			raise CameraError(f"replay source {source} doesn't exist")
+		self.recording = None
+		if self.images is None and splitext(source)[1].lower() == ".npy":
+			self.recording = FrameRecording(source)
+
+		self.decoded = Queue(maxsize = decode_ahead)
+		self.current_frame = None
+		self.frame_name = None
+		self.timestamp = None
+		self.sequence = 0 # sequence number of the latest frame, 0 before the first one
+		self.wanted_sequence = 0 # without realtime, frames are only published up to the one capture() is waiting for
+		self.returned_sequence = 0
+		self.returned_timestamp = None
+		self.returned_name = None
+		self.finished = False
+		self.error = None
+		self.running = True
+		self.condition = Condition()
+		self.threads = [Thread(target=self.__decode), Thread(target=self.__publish)]
+		for thread in self.threads:
+			thread.daemon = True
+			thread.start()
+		_open_replays.add(self)
+
+	def __del__(self):
+		self.running = False
+
+	def close(self):
+		'''stops decoding and publishing frames, waiting for the frame being decoded'''
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+		for thread in self.threads:
+			if thread is not current_thread():
+				thread.join()
+
+	def __listImages(self, source):
+		'''returns the images of the source in replay order, or None if it is a video'''
+		if isinstance(source, (list, tuple)):
+			return list(source)
+		if isdir(source):
+			return sorted([join(source, f) for f in listdir(source) if splitext(f)[1].lower() in image_extensions])
+		if splitext(source)[1].lower() in image_extensions:
+			return [source]
+		return None
+
+	def _isFresh(self):
+		return self.max_frame_age is None or monotonic() - self.timestamp <= self.max_frame_age
+
+	def capture(self, min_seq = None):
+		'''blocks until a frame with sequence number min_seq or later, and no older than max_frame_age seconds, is available and returns it.
+		By default waits for a frame newer than the one returned by the last call.
+		Raises ReplayFinished once there are no frames left, or CameraError if decoding failed or no such frame arrives within capture_timeout seconds'''
+		deadline = monotonic() + self.capture_timeout
+		with self.condition:
+			if min_seq is None:
+				min_seq = self.returned_sequence + 1
+			self.wanted_sequence = max(self.wanted_sequence, min_seq)
+			self.condition.notify_all()
+			while self.error is None and not self.finished and not (self.sequence >= min_seq and self._isFresh()):
+				remaining = deadline - monotonic()
+				if remaining <= 0:
+					raise CameraError(f"no frame arrived in {self.capture_timeout} seconds")
+				self.condition.wait(remaining)
+			if self.error is not None:
+				raise CameraError("replay stopped working") from self.error
+			if not (self.sequence >= min_seq and self._isFresh()):
+				raise ReplayFinished(f"replayed every frame of {self.source}")
+			self.returned_sequence = self.sequence
+			self.returned_timestamp = self.timestamp
+			self.returned_name = self.frame_name
+			return self.current_frame
+
+	def getSequence(self):
+		'''returns the sequence number of the frame returned by the last call to capture'''
+		return self.returned_sequence
+
+	def getTimestamp(self):
+		'''returns when (in time.monotonic() seconds) the frame returned by the last call to capture was published'''
+		return self.returned_timestamp
+
+	def getFrameName(self):
+		'''returns the name of the file (and, for videos, the frame number) the frame returned by the last call to capture was read from'''
+		return self.returned_name
+
+	def getRealResolution(self):
+		# replayed frames are scaled to the requested resolution
+		return self.resolution
+
+	def _prepareFrame(self, img):
+		if self.grayscale and img.ndim == 3:
+			img = cvtColor(img, COLOR_BGR2GRAY)
+		if img.shape[1] != self.resolution[0] or img.shape[0] != self.resolution[1]:
+			interpolation = INTER_AREA if img.shape[1] > self.resolution[0] else INTER_LINEAR
+			img = resize(img, tuple(int(size) for size in self.resolution), interpolation=interpolation)
+		return img
+
+	def __readImages(self):
+		for image in self.images:
+			img = imread(image, IMREAD_GRAYSCALE) if self.grayscale else imread(image)
+			if img is None:
+				raise CameraError(f"failed to read {image}")
+			yield splitext(basename(image))[0], img, None
+
+	def __readVideo(self):
+		cap = VideoCapture(self.source)
+		if not cap.isOpened():
+			raise CameraError(f"failed to open {self.source}")
+		if self.framerate is None and cap.get(CAP_PROP_FPS) > 0:
+			self.framerate = cap.get(CAP_PROP_FPS)
+		name = splitext(basename(self.source))[0]
+		index = 0
+		try:
+			while True:
+				ret, img = cap.read()
+				if ret != True:
+					return
+				yield f"{name}_{index}", img, cap.get(CAP_PROP_POS_MSEC) / 1000
+				index += 1
+		finally:
+			cap.release()
+
+	def __readRecording(self):
+		name = splitext(basename(self.source))[0]
+		for i in range(len(self.recording)):
+			yield f"{name}_{i}", self.recording[i], self.recording.getTimestamp(i)
+
+	def __readFrames(self):
+		'''yields the name, the image and, if the source has one, the timestamp in seconds of every frame, in replay order'''
+		while True:
+			if self.images is not None:
+				yield from self.__readImages()
+			elif self.recording is not None:
+				yield from self.__readRecording()
+			else:
+				yield from self.__readVideo()
+			if not self.loop:
+				return
+
+	def __decode(self):
+		try:
+			for name, img, timestamp in self.__readFrames():
+				if not self.__queueDecoded((name, self._prepareFrame(img), timestamp)):
+					return
+			self.__queueDecoded(None)
+		except Exception as error:
+			self.__queueDecoded(error)
+
+	def __queueDecoded(self, frame):
+		'''waits for room in the decoded frame queue, returning False if the replay was closed first'''
+		while self.running:
+			try:
+				self.decoded.put(frame, timeout = 0.1)
+				return True
+			except Full:
+				continue
+		return False
+
+	def __getDeadline(self, start, first_timestamp, index, timestamp):
+		'''returns when (in time.monotonic() seconds) a frame is due with realtime pacing, following the recorded timestamps when there are any'''
+		if timestamp is not None and first_timestamp is not None:
+			return start + timestamp - first_timestamp
+		return start + index / (self.framerate or 1)
+
+	def __publish(self):
+		start = None
+		first_timestamp = None
+		index = 0
+		while self.running:
+			try:
+				frame = self.decoded.get(timeout = 0.1)
+			except Empty:
+				continue
+			if frame is None or isinstance(frame, Exception):
+				with self.condition:
+					self.finished = frame is None
+					self.error = frame if frame is not None else None
+					self.condition.notify_all()
+				return
+
+			name, img, timestamp = frame
+			with self.condition:
+				if self.realtime:
+					if start is None:
+						start, first_timestamp = monotonic(), timestamp
+					deadline = self.__getDeadline(start, first_timestamp, index, timestamp)
+					self.condition.wait_for(lambda: not self.running or monotonic() >= deadline, max(0, deadline - monotonic()))
+				else:
+					self.condition.wait_for(lambda: not self.running or self.sequence < self.wanted_sequence)
+				self.current_frame = img
+				self.frame_name = name
+				self.timestamp = monotonic()
+				self.sequence += 1
+				index += 1
+				self.condition.notify_all()
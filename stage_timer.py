@@ -0,0 +1,77 @@
+from collections import deque
+from contextlib import nullcontext
+from csv import writer as csv_writer
+from json import dump
+from threading import Lock
+from time import perf_counter
+
+_disabled_measurement = nullcontext()
+
+class _Measurement:
+	def __init__(self, timer, stage):
+		self.timer = timer
+		self.stage = stage
+
+	def __enter__(self):
+		self.start = perf_counter()
+
+	def __exit__(self, error_type, *_):
+		# a stage that raised didn't finish, e.g. a capture that timed out, so its duration would skew the percentiles
+		if error_type is None:
+			self.timer.record(self.stage, perf_counter() - self.start)
+
+class StageTimer:
+	'''keeps the last window durations (in seconds, from a monotonic clock) of each named stage, to report their percentiles.
+	When disabled, measure() returns a shared no-op context manager, so leaving the instrumentation in costs next to nothing'''
+
+	percentiles = (50, 95, 99)
+
+	def __init__(self, enabled = True, window = 500):
+		self.enabled = enabled
+		self.window = window
+		self.durations = {}
+		self.lock = Lock()
+
+	def measure(self, stage):
+		'''context manager that records how long its block took as a duration of the stage'''
+		if not self.enabled:
+			return _disabled_measurement
+		return _Measurement(self, stage)
+
+	def record(self, stage, duration):
+		with self.lock:
+			if stage not in self.durations:
+				self.durations[stage] = deque(maxlen = self.window)
+			self.durations[stage].append(duration)
+
+	def getLast(self, stage):
+		'''returns the last duration of the stage, or None if it was never measured'''
+		with self.lock:
+			durations = self.durations.get(stage)
+			return durations[-1] if durations else None
+
+	def getSnapshot(self) -> dict:
+		'''returns, for each stage, how many durations are in the window, their mean, the last one and their p50, p95 and p99, in seconds'''
+		with self.lock:
+			durations = {stage: list(stage_durations) for stage, stage_durations in self.durations.items()}
+
+		from numpy import percentile, mean # imported here so importing the timer doesn't slow down startup
+		snapshot = {}
+		for stage, stage_durations in durations.items():
+			stage_percentiles = percentile(stage_durations, StageTimer.percentiles)
+			snapshot[stage] = {"count": len(stage_durations), "mean": float(mean(stage_durations)), "last": stage_durations[-1]}
+			for p, value in zip(StageTimer.percentiles, stage_percentiles):
+				snapshot[stage][f"p{p}"] = float(value)
+		return snapshot
+
+	def dumpJSON(self, path):
+		with open(path, "w") as f:
+			dump(self.getSnapshot(), f, indent = 4)
+
+	def dumpCSV(self, path):
+		columns = ["count", "mean", "last"] + [f"p{p}" for p in StageTimer.percentiles]
+		with open(path, "w", newline = "") as f:
+			csv = csv_writer(f)
+			csv.writerow(["stage"] + columns)
+			for stage, stats in self.getSnapshot().items():
+				csv.writerow([stage] + [stats[column] for column in columns])
@@ -1,17 +1,19 @@
 from board_reader import BoardReader
-from time import sleep
-from os import listdir
-from os.path import isfile, join
+from replay_camera import Camera as ReplayCamera
+from camera_error import ReplayFinished
 
 test_file_path = "test_images_find_corners"
-test_files = sorted([test_file_path + '/' + f for f in listdir(test_file_path) if isfile(join(test_file_path, f))])
 
 resolution = (1920, 1080) 
 board_dimensions = (8, 12)
 
-reader = BoardReader(resolution, board_dimensions, True, True)
+# the first image has every corner, and is read while the reader looks for the board corners
+reader = BoardReader(resolution, board_dimensions, True, True, camera=ReplayCamera(resolution, test_file_path))
 
-for image in test_files:
-	print(image)
-	reader.debug_path = image
-	board = reader.getBoard()
+try:
+	while True:
+		reader.updateBoard()
+		print(reader.camera.getFrameName())
+		board = reader.getBoard()
+except ReplayFinished:
+	pass
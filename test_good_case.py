@@ -3,9 +3,8 @@ from board_reader import BoardReader
 resolution = (1920, 1080) 
 board_dimensions = (8, 12)
 
-reader = BoardReader(resolution, board_dimensions, write_steps = False, DEBUG_MODE = True, print_time = True)
+reader = BoardReader(resolution, board_dimensions, write_steps = False, DEBUG_MODE = True, print_time = True, debug_path = "./test_image_real.png")
 
-reader.debug_path = "./test_image_real.png"
-board = reader.getBoard()
+reader.updateBoard()
 board = reader.getBoard()
 reader.printBoard(board)
\ No newline at end of file
@@ -1,13 +1,18 @@
 import chess
 
-def convertUCIPossibleMoves(possible_moves: list[tuple]) -> list[str]:
+def convertUCIPossibleMoves(possible_moves) -> list[str]:
+	'''converts moves (an array of BoardReader.move_dtype) to UCI strings'''
 	if possible_moves is None or len(possible_moves) == 0:
 		return []
 
-	moves = _convertPossibleMoves(possible_moves)
+	moves = _convertPossibleMoves(_toMoveTuples(possible_moves))
 	possible_moves_uci = [move.uci() for move in moves]
 	return possible_moves_uci
 
+# the logic below compares squares as tuples and removes moves from the list as they're paired
+def _toMoveTuples(moves):
+	return [(int(move['id']), tuple(move['origin'].tolist()), tuple(move['destination'].tolist())) for move in moves]
+
 def _convertPossibleMoves(moves):
 	uci_moves = _convertPossibleTwoPieceMoves(moves)
 	uci_moves += _convertPossibleOnePieceMoves(moves)